@@ -0,0 +1,164 @@
+import threading
+
+import numpy as np
+from sqlalchemy import func, select
+
+from extensions import db
+from models import Chapters, Questions, UserQuiz, UserResponse
+from mastery import DIFFICULTIES
+
+
+def load_response_arrays(chunk_size=100000):
+    """
+    Reads every graded response as columnar arrays (user_id, question_id,
+    chapter_id, difficulty index, is_correct), streaming the query in chunks.
+    """
+    difficulty_codes = {difficulty: i for i, difficulty in enumerate(DIFFICULTIES)}
+    query = select(
+        UserQuiz.user_id, UserResponse.question_id, Questions.chapter_id, Questions.difficulty, UserResponse.is_correct
+    ).join(UserQuiz, UserResponse.attempt_id == UserQuiz.id) \
+        .join(Questions, UserResponse.question_id == Questions.id) \
+        .where(Questions.difficulty.in_(DIFFICULTIES)) \
+        .execution_options(yield_per=chunk_size)
+
+    columns = {name: [] for name in ('user_id', 'question_id', 'chapter_id', 'difficulty', 'is_correct')}
+    for chunk in db.session.execute(query).partitions():
+        n = len(chunk)
+        user_ids, question_ids, chapter_ids, difficulties, correct = zip(*chunk)
+        columns['user_id'].append(np.fromiter(user_ids, dtype=np.int64, count=n))
+        columns['question_id'].append(np.fromiter(question_ids, dtype=np.int64, count=n))
+        columns['chapter_id'].append(np.fromiter(chapter_ids, dtype=np.int64, count=n))
+        columns['difficulty'].append(np.fromiter((difficulty_codes[d] for d in difficulties), dtype=np.int8, count=n))
+        columns['is_correct'].append(np.fromiter(correct, dtype=np.bool_, count=n))
+
+    empty = {'user_id': np.int64, 'question_id': np.int64, 'chapter_id': np.int64, 'difficulty': np.int8,
+             'is_correct': np.bool_}
+    return {name: np.concatenate(parts) if parts else np.empty(0, dtype=empty[name])
+            for name, parts in columns.items()}
+
+
+def _distribution(values, bins=10):
+    histogram, _ = np.histogram(values, bins=bins, range=(0.0, 1.0))
+    p25, median, p75 = np.percentile(values, [25, 50, 75])
+    return {
+        'students': int(len(values)),
+        'mean': float(values.mean()),
+        'p25': float(p25),
+        'median': float(median),
+        'p75': float(p75),
+        'histogram': histogram.tolist()
+    }
+
+
+def compute_cohort_analytics(arrays, chapter_names, weakest=10, min_students=5):
+    """
+    Cohort statistics over the response arrays:
+    - per (chapter, difficulty): distribution of per-student accuracy
+    - per question: p-value (share answered correctly) and discrimination,
+      the point-biserial correlation between answering the item correctly and
+      the student's accuracy on all other items
+    - the `weakest` (chapter, difficulty) topics by mean student accuracy,
+      among topics answered by at least `min_students` students
+    """
+    correct = arrays['is_correct'].astype(np.float64)
+    n_responses = len(correct)
+    if n_responses == 0:
+        return {'responses': 0, 'students': 0, 'topics': [], 'questions': [], 'weakest_topics': []}
+
+    users, user_idx = np.unique(arrays['user_id'], return_inverse=True)
+    chapters, chapter_idx = np.unique(arrays['chapter_id'], return_inverse=True)
+    n_users, n_buckets = len(users), len(chapters) * len(DIFFICULTIES)
+    bucket_idx = chapter_idx * len(DIFFICULTIES) + arrays['difficulty']
+
+    # Per-student accuracy in every (chapter, difficulty) bucket they answered,
+    # kept sparse: one entry per (student, bucket) pair that actually occurs.
+    cells, cell_idx = np.unique(user_idx * n_buckets + bucket_idx, return_inverse=True)
+    cell_total = np.bincount(cell_idx)
+    cell_accuracy = np.bincount(cell_idx, weights=correct) / cell_total
+    cell_bucket = cells % n_buckets  # cells are sorted by user, then bucket
+    order = np.argsort(cell_bucket, kind='stable')
+    buckets, starts = np.unique(cell_bucket[order], return_index=True)
+    ends = np.append(starts[1:], len(order))
+
+    topics = []
+    for b, start, end in zip(buckets, starts, ends):
+        members = order[start:end]
+        chapter_id = int(chapters[b // len(DIFFICULTIES)])
+        topics.append(dict(_distribution(cell_accuracy[members]), chapter_id=chapter_id,
+                           chapter=chapter_names.get(chapter_id), difficulty=DIFFICULTIES[b % len(DIFFICULTIES)],
+                           responses=int(cell_total[members].sum())))
+
+    # Rest score: the student's accuracy on their other responses.
+    user_total = np.bincount(user_idx, minlength=n_users).astype(np.float64)
+    user_correct = np.bincount(user_idx, weights=correct, minlength=n_users)
+    others = user_total[user_idx] - 1
+    rest = np.divide(user_correct[user_idx] - correct, others, out=np.zeros(n_responses), where=others > 0)
+
+    question_ids, question_idx = np.unique(arrays['question_id'], return_inverse=True)
+    n_questions = len(question_ids)
+    q_total = np.bincount(question_idx, minlength=n_questions).astype(np.float64)
+    q_correct = np.bincount(question_idx, weights=correct, minlength=n_questions)
+    p_values = q_correct / q_total
+
+    rest_sum = np.bincount(question_idx, weights=rest, minlength=n_questions)
+    rest_sq_sum = np.bincount(question_idx, weights=rest * rest, minlength=n_questions)
+    rest_correct_sum = np.bincount(question_idx, weights=rest * correct, minlength=n_questions)
+    rest_mean = rest_sum / q_total
+    rest_std = np.sqrt(np.maximum(rest_sq_sum / q_total - rest_mean ** 2, 0.0))
+    q_incorrect = q_total - q_correct
+    mean_if_correct = np.divide(rest_correct_sum, q_correct, out=np.zeros(n_questions), where=q_correct > 0)
+    mean_if_incorrect = np.divide(rest_sum - rest_correct_sum, q_incorrect, out=np.zeros(n_questions),
+                                  where=q_incorrect > 0)
+    defined = (rest_std > 0) & (q_correct > 0) & (q_incorrect > 0)
+    discrimination = np.full(n_questions, np.nan)
+    discrimination[defined] = ((mean_if_correct - mean_if_incorrect)[defined] / rest_std[defined]
+                               * np.sqrt(p_values[defined] * (1 - p_values[defined])))
+
+    questions = [{
+        'question_id': int(q_id),
+        'responses': int(total),
+        'p_value': float(p),
+        'discrimination': None if np.isnan(d) else float(d)
+    } for q_id, total, p, d in zip(question_ids, q_total, p_values, discrimination)]
+
+    weakest_topics = sorted((t for t in topics if t['students'] >= min_students), key=lambda t: t['mean'])[:weakest]
+
+    return {
+        'responses': int(n_responses),
+        'students': int(n_users),
+        'topics': topics,
+        'questions': questions,
+        'weakest_topics': [{key: t[key] for key in ('chapter_id', 'chapter', 'difficulty', 'mean', 'students')}
+                           for t in weakest_topics]
+    }
+
+
+class CohortAnalytics:
+    """
+    Caches the cohort report until a new attempt is recorded, detected through
+    max(user_quiz.id) so submissions handled by other processes count too.
+    """
+
+    def __init__(self):
+        self._watermark = None
+        self._report = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._report = None
+
+    def get(self):
+        watermark = db.session.query(func.max(UserQuiz.id)).scalar()
+        if self._report is not None and watermark == self._watermark:
+            return self._report
+
+        with self._lock:
+            if self._report is not None and watermark == self._watermark:
+                return self._report
+            chapter_names = dict(db.session.query(Chapters.id, Chapters.name).all())
+            self._report = compute_cohort_analytics(load_response_arrays(), chapter_names)
+            self._watermark = watermark
+        return self._report
+
+
+cohort_analytics = CohortAnalytics()
@@ -1,26 +1,111 @@
-from flask import Flask, request, jsonify, abort
+from flask import Flask, Response, request, jsonify, abort, stream_with_context
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from flask_cors import CORS
-from extensions import db
-from werkzeug.security import check_password_hash, generate_password_hash
+from extensions import db, configure_sqlite
 import os
+import csv
+import functools
+import io
+import json
+import gzip
+import hashlib
+import hmac
 from datetime import datetime, timezone, timedelta
-import random
-from quiz_selector import generate_adaptive_quiz 
-from quiz_env import QuizEnv
-from dqn_agent import DQNAgent
+from quiz_selector import select_adaptive_question_ids, get_agent_policy, get_quiz_layout, cached_quiz_layout, recent_question_ids
+from policy_batcher import BatchedPolicy
+from grading import grade_answers, record_attempt, create_quiz, next_quiz_remarks
+from provisioning import create_default_quiz_for_user, provision_users, read_roster
+from quiz_jobs import QuizJobRunner
+from quiz_queue import PreparedQuizQueue
+from mastery import get_mastery
+from cache import TTLCache
+from password_hashing import PasswordHasher, HasherBusy
+from analytics import cohort_analytics
+from irt import get_user_ability
+from instrumentation import instrumentation
+from sqlalchemy import func, and_, or_, case
 
 
 app = Flask(__name__)
 app.secret_key = 'MyProject'
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.instance_path, 'quiz.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(app.instance_path, 'quiz.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Concurrent submissions can share one DQN forward pass (batch sizes above 1). Off by default: the
+# shipped 18-action model is cheaper to call directly than to queue; raise it for larger models.
+app.config['POLICY_MAX_BATCH_SIZE'] = int(os.environ.get('POLICY_MAX_BATCH_SIZE', 1))
+app.config['POLICY_MAX_WAIT_MS'] = float(os.environ.get('POLICY_MAX_WAIT_MS', 2))
+# When enabled, submit_quiz returns right after grading and the next quiz is built by a background worker.
+app.config['ASYNC_QUIZ_GENERATION'] = os.environ.get('ASYNC_QUIZ_GENERATION', '0') == '1'
+app.config['QUIZ_JOB_WORKERS'] = int(os.environ.get('QUIZ_JOB_WORKERS', 2))
+# A background job still running this long after it was queued is re-run by any live process.
+app.config['QUIZ_JOB_STALE_SECONDS'] = float(os.environ.get('QUIZ_JOB_STALE_SECONDS', 300))
+app.config['DASHBOARD_CACHE_SIZE'] = int(os.environ.get('DASHBOARD_CACHE_SIZE', 4096))
+app.config['DASHBOARD_CACHE_TTL'] = float(os.environ.get('DASHBOARD_CACHE_TTL', 60))
+# Next quizzes planned ahead per student (0 disables), and how far any entry of the agent's
+# state may move before a prepared quiz is discarded.
+app.config['PREPARED_QUIZ_DEPTH'] = int(os.environ.get('PREPARED_QUIZ_DEPTH', 1))
+app.config['PREPARED_QUIZ_MAX_DRIFT'] = float(os.environ.get('PREPARED_QUIZ_MAX_DRIFT', 0.15))
+app.config['QUIZ_CACHE_SIZE'] = int(os.environ.get('QUIZ_CACHE_SIZE', 4096))
+app.config['QUIZ_CACHE_TTL'] = float(os.environ.get('QUIZ_CACHE_TTL', 3600))
+# Password hashing runs on a process pool; when more than PASSWORD_HASH_MAX_PENDING hashes are
+# queued, /login and /register answer 503. PASSWORD_HASH_WORKERS=0 hashes in the request thread.
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 64))
+app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD')  # Werkzeug default when unset
+# Roster imports hash on their own pool of this many processes, so they never hold up logins.
+app.config['PASSWORD_BULK_HASH_WORKERS'] = int(os.environ.get('PASSWORD_BULK_HASH_WORKERS', 1))
+# Per-route timing/SQL metrics on /metrics; off by default. Sampled requests slower than
+# PROFILE_SLOW_MS are dumped as cProfile files to PROFILE_DIR.
+app.config['INSTRUMENTATION'] = os.environ.get('INSTRUMENTATION', '0') == '1'
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_SLOW_MS'] = float(os.environ.get('PROFILE_SLOW_MS', 500))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+# Bearer token for scraping /metrics; without it only logged-in admins can read them.
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+# Connections are pooled per process; SQLite waits up to DB_BUSY_TIMEOUT seconds on a locked database.
+if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite:///:memory:'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_pre_ping': True,
+    }
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args'] = {
+            'timeout': float(os.environ.get('DB_BUSY_TIMEOUT', 15))
+        }
 db.init_app(app)
+with app.app_context():
+    configure_sqlite(db.engine)
+    instrumentation.init_app(app, db.engine)
 
 CORS(app, supports_credentials=True, origins=["*"])
 
-from models import User, Chapters, QuizQuestion, Quiz, UserResponse, Performance, UserQuiz, Questions
+# Per-user dashboard payloads; submit_quiz drops the submitting user's entry.
+dashboard_cache = TTLCache(maxsize=app.config['DASHBOARD_CACHE_SIZE'], ttl=app.config['DASHBOARD_CACHE_TTL'])
+# Serialized GET /api/quiz/<id> payloads; a quiz's questions never change once it is created.
+quiz_payload_cache = TTLCache(maxsize=app.config['QUIZ_CACHE_SIZE'], ttl=app.config['QUIZ_CACHE_TTL'])
+
+password_hasher = PasswordHasher(
+    max_workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+    method=app.config['PASSWORD_HASH_METHOD'],
+    timeout=app.config['PASSWORD_HASH_TIMEOUT']
+)
+bulk_password_hasher = PasswordHasher(
+    max_workers=app.config['PASSWORD_BULK_HASH_WORKERS'],
+    method=app.config['PASSWORD_HASH_METHOD']
+)
+
+policy_batcher = BatchedPolicy(
+    get_agent_policy,
+    max_batch_size=app.config['POLICY_MAX_BATCH_SIZE'],
+    max_wait_ms=app.config['POLICY_MAX_WAIT_MS'],
+    get_valid_actions=lambda: cached_quiz_layout()[1]
+)
+
+from models import User, Chapters, QuizQuestion, Quiz, UserResponse, UserQuiz, Questions, QuizJob, UserMastery
 
 # Initialize LoginManager
 login_manager = LoginManager()
@@ -31,6 +116,20 @@ login_manager.login_view = 'login'
 def load_user(user_id):
     return db.session.get(User, int(user_id))
 
+def admin_required(view):
+    @functools.wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if not current_user.is_admin:
+            return jsonify({'error': 'Unauthorized'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def server_busy():
+    response = jsonify(success=False, message="Server busy, please try again")
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     data = request.get_json()
@@ -38,8 +137,15 @@ def login():
     password = data.get('password')
     user = User.query.filter_by(email=email).first()
 
-    if user and check_password_hash(user.password, password):
+    try:
+        valid = user is not None and password_hasher.verify(user.password, password)
+    except HasherBusy:
+        return server_busy()
+
+    if valid:
         login_user(user)
+        if not user.is_admin:
+            quiz_queue.refill(user.id)
         return jsonify(success=True, user_id=user.id, is_admin=user.is_admin)
     else:
         return jsonify(success=False, message="Invalid credentials"), 401
@@ -57,9 +163,14 @@ def register():
     if User.query.filter_by(email=email).first():
         return jsonify({"success": False, "message": "Email already registered"}), 400
 
+    try:
+        password_hash = password_hasher.hash(password)
+    except HasherBusy:
+        return server_busy()
+
     new_user = User(
         email=email,
-        password=generate_password_hash(password),
+        password=password_hash,
         fullname=fullname,
         dob=dob,
         is_admin=is_admin
@@ -84,31 +195,6 @@ def logout():
     return jsonify({"success": True, "message": "Logged out"}), 200
 
 
-def create_default_quiz_for_user(user_id):
-    chapters = Chapters.query.all()
-    quiz_questions = []
-
-    for chapter in chapters:
-        for difficulty in ['easy', 'medium', 'hard']:
-            questions = Questions.query.filter_by(chapter_id=chapter.id, difficulty=difficulty).all()
-            if len(questions) >= 2:
-                quiz_questions.extend(random.sample(questions, 2))
-
-            else:
-                print(f"Not enough questions in chapter {chapter.name} for difficulty {difficulty}. Skipping.")
-                continue
-
-    default_quiz = Quiz(user_id=user_id, duration=15, remarks='First Step')
-
-    db.session.add(default_quiz)
-    db.session.commit()
-
-    for question in quiz_questions:
-        db.session.add(QuizQuestion(quiz_id=default_quiz.id, question_id=question.id))
-
-    db.session.commit()
-
-
 #fetch current user in session info
 @app.route('/api/user', methods=['GET'])
 @login_required
@@ -134,35 +220,58 @@ def get_user():
 def get_dashboard_data():
     try:
         user = current_user
-        recent_attempts = UserQuiz.query.filter_by(user_id=user.id).order_by(UserQuiz.timestamp.desc()).limit(5).all()
-        streak = calculate_streak(recent_attempts)
-        total_xp, level = calculate_xp_level(recent_attempts)
-        overall_progress = calculate_overall_progress(user)
-        avg_score = calculate_avg_score(recent_attempts)
-        time_spent = calculate_time_spent(recent_attempts)
-        adaptive_level = calculate_adaptive_level(user)
-        subject_stats = calculate_subject_stats(user)
-
-        return jsonify({
-            "streak": streak,
-            "xp": int(total_xp),
-            "level": level,
-            "overallProgress": overall_progress,
-            "avgScore": avg_score,
-            "timeSpent": time_spent,
-            "adaptiveLevel": adaptive_level,
-            "subjectStats": subject_stats,
-            "user": {
-                "id": user.id,
-                "name": user.fullname,
-                "email": user.email,
-                "dob": user.dob
-            }
-        })
+        dashboard = dashboard_cache.get(user.id)
+        if dashboard is None:
+            dashboard = build_dashboard(user)
+            dashboard_cache.set(user.id, dashboard)
+        return jsonify(dashboard)
     except Exception as e:
         print(f"Error fetching dashboard data: {e}")
         abort(500, description="Internal Server Error")
 
+def build_dashboard(user):
+    recent_attempts = UserQuiz.query.filter_by(user_id=user.id).order_by(UserQuiz.timestamp.desc()).limit(5).all()
+    chapter_mastery = load_chapter_mastery(user.id)
+    streak = calculate_streak(recent_attempts)
+    total_xp, level = calculate_xp_level(recent_attempts)
+    overall_progress = calculate_overall_progress(chapter_mastery)
+    avg_score = calculate_avg_score(recent_attempts)
+    time_spent = calculate_time_spent(recent_attempts)
+    adaptive_level = calculate_adaptive_level(chapter_mastery)
+    subject_stats = calculate_subject_stats(chapter_mastery)
+
+    return {
+        "streak": streak,
+        "xp": int(total_xp),
+        "level": level,
+        "overallProgress": overall_progress,
+        "avgScore": avg_score,
+        "timeSpent": time_spent,
+        "adaptiveLevel": adaptive_level,
+        "subjectStats": subject_stats,
+        "user": {
+            "id": user.id,
+            "name": user.fullname,
+            "email": user.email,
+            "dob": user.dob
+        }
+    }
+
+def load_chapter_mastery(user_id):
+    # One row per (chapter, difficulty) the user has answered, plus one row with
+    # difficulty=None for every chapter they have not touched yet.
+    return (
+        db.session.query(
+            Chapters.id, Chapters.name, UserMastery.difficulty,
+            func.coalesce(func.sum(UserMastery.correct), 0),
+            func.coalesce(func.sum(UserMastery.total), 0)
+        )
+        .outerjoin(UserMastery, and_(UserMastery.chapter_id == Chapters.id, UserMastery.user_id == user_id))
+        .group_by(Chapters.id, UserMastery.difficulty)
+        .order_by(Chapters.id)
+        .all()
+    )
+
 def calculate_streak(recent_attempts):
     streak = 0
     today = datetime.now(timezone.utc).date()
@@ -189,15 +298,10 @@ def calculate_xp_level(recent_attempts):
         level = "Advanced"
     return total_xp, level
 
-def calculate_overall_progress(user):
-    total_chapters = Chapters.query.count()
-    # We check if the user has any performance data on chapters
-    attempted_chapters = (
-        db.session.query(Performance.chapter_id)
-        .filter_by(user_id=user.id)
-        .distinct()
-        .count()
-    )
+def calculate_overall_progress(chapter_mastery):
+    total_chapters = len({ch_id for ch_id, _, _, _, _ in chapter_mastery})
+    # We check if the user has answered anything in each chapter
+    attempted_chapters = len({ch_id for ch_id, _, _, _, total in chapter_mastery if total > 0})
     return round((attempted_chapters / total_chapters) * 100) if total_chapters else 0
 
 def calculate_avg_score(recent_attempts):
@@ -208,28 +312,30 @@ def calculate_time_spent(recent_attempts):
     minutes = total_seconds // 60
     return f"{minutes // 60} hrs {minutes % 60} min"
 
-def calculate_adaptive_level(user):
-    perf = Performance.query.filter_by(user_id=user.id).all()
-    hard = sum(p.hard_correct for p in perf)
-    medium = sum(p.medium_correct for p in perf)
-    easy = sum(p.easy_correct for p in perf)
+def calculate_adaptive_level(chapter_mastery):
+    correct_by_difficulty = {}
+    for _, _, difficulty, correct, _ in chapter_mastery:
+        correct_by_difficulty[difficulty] = correct_by_difficulty.get(difficulty, 0) + correct
+    hard = correct_by_difficulty.get('hard', 0)
+    medium = correct_by_difficulty.get('medium', 0)
+    easy = correct_by_difficulty.get('easy', 0)
     if hard > medium and hard > easy:
         return "Advanced"
     elif medium > easy:
         return "Intermediate"
     return "Beginner"
 
-def calculate_subject_stats(user):
+def calculate_subject_stats(chapter_mastery):
     subject_stats = []
-    chapters = Chapters.query.all()
-    for ch in chapters:
-        ch_perf = Performance.query.filter_by(user_id=user.id, chapter_id=ch.id).first()
-        total_correct = 0
-        if ch_perf:
-            total_correct = ch_perf.easy_correct + ch_perf.medium_correct + ch_perf.hard_correct
+    chapters = {}
+    for ch_id, name, _, correct, _ in chapter_mastery:
+        chapter = chapters.setdefault(ch_id, {"name": name, "correct": 0})
+        chapter["correct"] += correct
+    for chapter in chapters.values():
+        total_correct = chapter["correct"]
         completion = min(100, total_correct * 10)
         subject_stats.append({
-            "name": ch.name,
+            "name": chapter["name"],
             "icon": "📘",
             "completion": completion,
             "buttonText": "Continue" if total_correct else "Start Quiz"
@@ -260,229 +366,257 @@ def get_available_quizzes():
     })
 
 
+def build_quiz_payload(quiz_id):
+    """
+    Serializes a quiz with one joined query. Returns None if the quiz does not exist.
+    """
+    rows = db.session.query(
+        Quiz.user_id, Quiz.duration, Questions.id, Questions.question, Questions.option_a, Questions.option_b,
+        Questions.option_c, Questions.option_d, Questions.difficulty, Chapters.name
+    ).outerjoin(QuizQuestion, QuizQuestion.quiz_id == Quiz.id) \
+        .outerjoin(Questions, Questions.id == QuizQuestion.question_id) \
+        .outerjoin(Chapters, Chapters.id == Questions.chapter_id) \
+        .filter(Quiz.id == quiz_id) \
+        .order_by(QuizQuestion.id).all()
+    if not rows:
+        return None
+
+    questions = [{
+        'id': question_id,
+        'question': question,
+        'option_a': option_a,
+        'option_b': option_b,
+        'option_c': option_c,
+        'option_d': option_d,
+        'chapter': chapter_name if chapter_name else "N/A",
+        'difficulty': difficulty
+    } for _, _, question_id, question, option_a, option_b, option_c, option_d, difficulty, chapter_name in rows
+        if question_id is not None]
+
+    body = app.json.dumps({'questions': questions, 'duration': rows[0].duration * 60}).encode()
+    return {
+        'user_id': rows[0].user_id,
+        'body': body,
+        'gzip': gzip.compress(body, compresslevel=6),
+        'etag': hashlib.sha1(body).hexdigest()
+    }
+
+
 @app.route('/api/quiz/<int:quiz_id>', methods=['GET'])
 @login_required
 def get_quiz_questions(quiz_id):
-    quiz = Quiz.query.get_or_404(quiz_id)
-
-    if quiz.user_id != current_user.id:
+    payload = quiz_payload_cache.get(quiz_id)
+    if payload is None:
+        payload = build_quiz_payload(quiz_id)
+        if payload is None:
+            abort(404)
+        quiz_payload_cache.set(quiz_id, payload)
+
+    if payload['user_id'] != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
 
-    questions = []
-    for quiz_question in quiz.questions:
-        question = quiz_question.question
-        questions.append({
-            'id': question.id,
-            'question': question.question,
-            'option_a': question.option_a,
-            'option_b': question.option_b,
-            'option_c': question.option_c,
-            'option_d': question.option_d,
-            'chapter': question.chapter.name if question.chapter else "N/A",
-            'difficulty': question.difficulty
-        })
-
-    return jsonify({'questions': questions, 'duration': quiz.duration * 60})
+    # Weak ETag: the same JSON is served either gzipped or as-is.
+    if 'gzip' in request.accept_encodings:
+        response = Response(payload['gzip'], mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(payload['body'], mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.set_etag(payload['etag'], weak=True)
+    return response.make_conditional(request)
 
 def get_user_performance_state(user_id):
-    performance_data = Performance.query.filter_by(user_id=user_id).all()
-
-    performance_map = {1: {'easy': {'correct': 0, 'total': 0}, 'medium': {'correct': 0, 'total': 0}, 'hard': {'correct': 0, 'total': 0}},
-                       2: {'easy': {'correct': 0, 'total': 0}, 'medium': {'correct': 0, 'total': 0}, 'hard': {'correct': 0, 'total': 0}},
-                       3: {'easy': {'correct': 0, 'total': 0}, 'medium': {'correct': 0, 'total': 0}, 'hard': {'correct': 0, 'total': 0}},
-                       4: {'easy': {'correct': 0, 'total': 0}, 'medium': {'correct': 0, 'total': 0}, 'hard': {'correct': 0, 'total': 0}},
-                       5: {'easy': {'correct': 0, 'total': 0}, 'medium': {'correct': 0, 'total': 0}, 'hard': {'correct': 0, 'total': 0}},
-                       6: {'easy': {'correct': 0, 'total': 0}, 'medium': {'correct': 0, 'total': 0}, 'hard': {'correct': 0, 'total': 0}}}
-
-    for record in performance_data:
-        performance_map[record.chapter_id]['easy']['correct'] += record.easy_correct
-        performance_map[record.chapter_id]['medium']['correct'] += record.medium_correct
-        performance_map[record.chapter_id]['hard']['correct'] += record.hard_correct
-
-        performance_map[record.chapter_id]['easy']['total'] += record.easy_total
-        performance_map[record.chapter_id]['medium']['total'] += record.medium_total
-        performance_map[record.chapter_id]['hard']['total'] += record.hard_total
-
-    state = []
-    for chapter in performance_map:
-        for difficulty in ['easy', 'medium', 'hard']:
-            correct = performance_map[chapter][difficulty]['correct']
-            total = performance_map[chapter][difficulty]['total']
-            normalized_score = correct / total if total > 0 else 0.0
-            state.append(normalized_score)
-
-    return {'state': state}
+    env, _ = get_quiz_layout()
+    return {'state': env.mastery_state(get_mastery(user_id)).tolist()}
 
-@app.route("/api/quiz/<int:quiz_id>/submit", methods=["POST"])
-@login_required
-def submit_quiz(quiz_id):
-    data = request.json
-    user_answers = data.get('answers')  # { question_id: selected_option }
-    time_taken = data.get('time_taken')
+def plan_next_quiz(user_id, state=None):
+    if state is None:
+        state = get_user_performance_state(user_id)['state']
+    env, _ = get_quiz_layout()
 
-    user_quiz = UserQuiz(user_id=current_user.id, quiz_id=quiz_id, time_taken=time_taken)
-    db.session.add(user_quiz)
-    db.session.commit()
+    with instrumentation.stage('policy'):
+        action = policy_batcher.act(env.to_sparse(state))
+    next_chapter, next_difficulty = env.decode_action(action)
 
-    total_questions = len(user_answers)
-    correct_answers = sum(1 for q_id, user_ans in user_answers.items() if Questions.query.get(q_id).correct_answer == user_ans)
-    score = correct_answers / total_questions if total_questions > 0 else 0.0
+    with instrumentation.stage('question_selection'):
+        new_question_ids = select_adaptive_question_ids(next_chapter, next_difficulty,
+                                                        num_questions=20, ability=get_user_ability(user_id),
+                                                        exclude=recent_question_ids([user_id]).get(user_id))
+    return state, next_chapter, next_difficulty, new_question_ids
 
-    user_quiz.score = score
-    db.session.commit()
 
-    performance_map = {}
-    difficulty_count = {}
-
-    for q_id, user_ans in user_answers.items():
-        question = Questions.query.get(q_id)
-        if not question:
-            continue
-        is_correct = question.correct_answer == user_ans
-
-        user_response = UserResponse(
-            attempt_id=user_quiz.id,
-            question_id=question.id,
-            user_answer=user_ans,
-            is_correct=is_correct,
-            chapter_id=question.chapter_id
-        )
-        db.session.add(user_response)
+def build_next_quiz(user_id, performance_map, state=None):
+    _, next_chapter, next_difficulty, new_question_ids = plan_next_quiz(user_id, state)
+    new_quiz = create_quiz(user_id, new_question_ids, duration=10, remarks=next_quiz_remarks(user_id),
+                           selected_chapter=next_chapter, difficulty=next_difficulty)
+    return new_quiz.id, next_chapter, next_difficulty
 
-        ch = question.chapter_id
-        diff = question.difficulty
-        if ch not in performance_map:
-            performance_map[ch] = {'easy': 0, 'medium': 0, 'hard': 0}
-        if is_correct:
-            performance_map[ch][diff] += 1
 
-        difficulty_count.setdefault((ch, diff), 0)
-        difficulty_count[(ch, diff)] += 1
+def claim_or_build_next_quiz(user_id, performance_map):
+    # A quiz prepared in the background is used when the student's state has not moved much since.
+    state = get_user_performance_state(user_id)['state']
+    prepared = quiz_queue.claim(user_id, state)
+    if prepared is None:
+        return build_next_quiz(user_id, performance_map, state)
+    new_quiz = create_quiz(user_id, prepared['question_ids'], duration=10, remarks=next_quiz_remarks(user_id),
+                           selected_chapter=prepared['selected_chapter'], difficulty=prepared['difficulty'])
+    return new_quiz.id, prepared['selected_chapter'], prepared['difficulty']
 
-    db.session.commit()
 
-    for ch_id, counts in performance_map.items():
-        easy_total = difficulty_count.get((ch_id, 'easy'), 0)
-        medium_total = difficulty_count.get((ch_id, 'medium'), 0)
-        hard_total = difficulty_count.get((ch_id, 'hard'), 0)
-
-
-        perf = Performance(
-            user_id=current_user.id,
-            chapter_id=ch_id,
-            quiz_id=quiz_id,
-            easy_correct=counts['easy'],
-            medium_correct=counts['medium'],
-            hard_correct=counts['hard'],
-            easy_total=easy_total,
-            medium_total=medium_total,
-            hard_total=hard_total
-        )
-        db.session.add(perf)
+def next_quiz_plan(next_chapter, next_difficulty):
+    return {
+        "selected_chapter": next_chapter,
+        "difficulty": next_difficulty,
+        "reason": f"Low scores in {next_chapter} ({next_difficulty})"
+    }
 
-    db.session.commit()
 
-    try:
-        state = get_user_performance_state(current_user.id)['state']
-        env = QuizEnv()
-        agent = DQNAgent(state_size=18, action_size=18)
+quiz_jobs = QuizJobRunner(app, build_next_quiz, max_workers=app.config['QUIZ_JOB_WORKERS'],
+                          stale_after=app.config['QUIZ_JOB_STALE_SECONDS'])
+
+# The target chapter/difficulty comes from the policy, so planning needs no performance map.
+quiz_queue = PreparedQuizQueue(app, lambda user_id: plan_next_quiz(user_id),
+                               depth=app.config['PREPARED_QUIZ_DEPTH'],
+                               max_drift=app.config['PREPARED_QUIZ_MAX_DRIFT'])
 
-        action = agent.act(state)
-        next_chapter, next_difficulty = env.decode_action(action)
 
-        new_questions = generate_adaptive_quiz(performance_map, next_chapter, next_difficulty, num_questions=20)
+@app.before_request
+def resume_quiz_jobs():
+    # Picks up jobs orphaned by a crash under any server, not just the dev reloader.
+    quiz_jobs.maybe_resume()
+
+
+@app.route("/api/quiz/<int:quiz_id>/submit", methods=["POST"])
+@login_required
+def submit_quiz(quiz_id):
+    data = request.json
+    user_answers = data.get('answers')  # { question_id: selected_option }
+    time_taken = data.get('time_taken')
+    run_async = data.get('async', app.config['ASYNC_QUIZ_GENERATION'])
+
+    # Everything below runs in one transaction with a fixed number of statements.
+    graded = grade_answers(user_answers)
+    record_attempt(current_user.id, quiz_id, graded, time_taken)
+
+    if run_async:
+        job = quiz_jobs.create(current_user.id, graded.performance_map)
+        job_id = job.id
+        db.session.commit()
+        dashboard_cache.invalidate(current_user.id)
+        quiz_jobs.submit(job_id)
+
+        return jsonify({
+            'message': 'Quiz submitted; new quiz is being generated.',
+            'new_quiz_id': None,
+            'job_id': job_id,
+            'status': 'pending'
+        }), 202
+
+    try:
+        new_quiz_id, next_chapter, next_difficulty = claim_or_build_next_quiz(current_user.id,
+                                                                              graded.performance_map)
 
     except Exception as e:
         print(f"[ERROR] Failed to generate adaptive quiz: {e}")
+        db.session.rollback()
+        record_attempt(current_user.id, quiz_id, graded, time_taken)
+        db.session.commit()
+        dashboard_cache.invalidate(current_user.id)
         return jsonify({'error': 'Quiz submitted but new quiz generation failed.'}), 500
-    
-    quiz_count = Quiz.query.filter_by(user_id=current_user.id).count()
-    if quiz_count == 0:
-        remarks = "First Step"
-    else:
-        remarks = f"Next Step {quiz_count}"
-
-    new_quiz = Quiz(user_id=current_user.id, duration=10, remarks=remarks)
-    db.session.add(new_quiz)
-    db.session.commit()
-
-    for q in new_questions:
-        qq = QuizQuestion(quiz_id=new_quiz.id, question_id=q.id)
-        db.session.add(qq)
 
     db.session.commit()
-
-    next_quiz_plan = {
-        "selected_chapter": next_chapter,
-        "difficulty": next_difficulty,
-        "reason": f"Low scores in {next_chapter} ({next_difficulty})"
-    }
+    dashboard_cache.invalidate(current_user.id)
+    quiz_queue.refill(current_user.id)
 
     return jsonify({
         'message': 'Quiz submitted and new quiz generated.',
-        'new_quiz_id': new_quiz.id,
-        'nextQuizPlan': next_quiz_plan
+        'new_quiz_id': new_quiz_id,
+        'nextQuizPlan': next_quiz_plan(next_chapter, next_difficulty)
     }), 200
 
 
+@app.route('/api/quiz-jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_quiz_job(job_id):
+    job = db.session.get(QuizJob, job_id)
+    if not job or job.user_id != current_user.id:
+        return jsonify({'error': 'Job not found'}), 404
+
+    response = {'job_id': job.id, 'status': job.status, 'new_quiz_id': job.quiz_id}
+    if job.status == 'done':
+        response['nextQuizPlan'] = next_quiz_plan(job.selected_chapter, job.difficulty)
+    elif job.status == 'failed':
+        response['error'] = 'New quiz generation failed.'
+    return jsonify(response), 200
+
+
 
 
 @app.route('/quiz-history', methods=['GET'])
 @login_required
 def get_quiz_history():
     user_id = current_user.id
-    quizzes = UserQuiz.query.filter_by(user_id=user_id).all()
-    quiz_data = []
-
-    for quiz_attempt in quizzes:
-        quiz = db.session.get(Quiz, quiz_attempt.quiz_id)
-        if not quiz:
-            continue
-
-        responses = UserResponse.query \
-            .filter_by(attempt_id=quiz_attempt.id) \
-            .join(Questions, UserResponse.question_id == Questions.id) \
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    cursor = request.args.get('cursor', type=int)  # id of the last attempt on the previous page
+
+    # Newest first, keyset-paginated on (timestamp, id). The cursor row's timestamp is
+    # read back in SQL so the comparison uses the stored value as-is.
+    page_query = db.session.query(
+        UserQuiz.id, UserQuiz.score, UserQuiz.timestamp, Quiz.id, Quiz.remarks, Quiz.duration
+    ).join(Quiz, Quiz.id == UserQuiz.quiz_id).filter(UserQuiz.user_id == user_id)
+    if cursor is not None:
+        cursor_row = db.session.query(UserQuiz.id).filter(UserQuiz.id == cursor, UserQuiz.user_id == user_id)
+        if cursor_row.first() is None:
+            # Unknown or another user's attempt; an empty page would look like the end of the history.
+            return jsonify({'error': 'Invalid cursor'}), 400
+        cursor_timestamp = db.session.query(UserQuiz.timestamp).filter(UserQuiz.id == cursor).scalar_subquery()
+        page_query = page_query.filter(or_(
+            UserQuiz.timestamp < cursor_timestamp,
+            and_(UserQuiz.timestamp == cursor_timestamp, UserQuiz.id < cursor)
+        ))
+    attempts = page_query.order_by(UserQuiz.timestamp.desc(), UserQuiz.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(attempts) > limit:
+        attempts = attempts[:limit]
+        next_cursor = attempts[-1][0]
+
+    breakdowns = {}  # { attempt_id: [ { chapter, difficulty, correct, incorrect } ] }
+    attempt_ids = [attempt[0] for attempt in attempts]
+    if attempt_ids:
+        grouped = db.session.query(
+            UserResponse.attempt_id, Chapters.name, Questions.difficulty,
+            func.sum(case((UserResponse.is_correct, 1), else_=0)), func.count(UserResponse.id)
+        ).join(Questions, UserResponse.question_id == Questions.id) \
             .join(Chapters, Questions.chapter_id == Chapters.id) \
-            .add_columns(Chapters.name.label('chapter_name'), Questions.difficulty, UserResponse.is_correct) \
+            .filter(UserResponse.attempt_id.in_(attempt_ids)) \
+            .group_by(UserResponse.attempt_id, Chapters.id, Questions.difficulty) \
             .all()
 
-        breakdown = {}  # { (chapter, difficulty): { correct: X, incorrect: Y } }
-
-        for _, chapter_name, difficulty, is_correct in responses:
-            key = (chapter_name, difficulty)
-            if key not in breakdown:
-                breakdown[key] = {"correct": 0, "incorrect": 0}
-            if is_correct:
-                breakdown[key]["correct"] += 1
-            else:
-                breakdown[key]["incorrect"] += 1
-
-        chapter_entries = []
-        total_correct = 0
-        total_incorrect = 0
-
-        for (chapter, difficulty), stats in breakdown.items():
-            chapter_entries.append({
-                "chapter": chapter,
+        for attempt_id, chapter_name, difficulty, correct, answered in grouped:
+            breakdowns.setdefault(attempt_id, []).append({
+                "chapter": chapter_name,
                 "difficulty": difficulty,
-                "correct": stats["correct"],
-                "incorrect": stats["incorrect"]
+                "correct": correct,
+                "incorrect": answered - correct
             })
-            total_correct += stats["correct"]
-            total_incorrect += stats["incorrect"]
 
-        total_questions = total_correct + total_incorrect
-        score = round(quiz_attempt.score * 100, 2)
+    quiz_data = []
+    for attempt_id, attempt_score, timestamp, quiz_id, remarks, duration in attempts:
+        chapter_entries = breakdowns.get(attempt_id, [])
+        total_correct = sum(entry["correct"] for entry in chapter_entries)
+        total_incorrect = sum(entry["incorrect"] for entry in chapter_entries)
 
         quiz_data.append({
-            "quiz_id": quiz.id,
-            "remarks": quiz.remarks,
-            "score": score,
-            "total": total_questions,
+            "quiz_id": quiz_id,
+            "remarks": remarks,
+            "score": round((attempt_score or 0) * 100, 2),
+            "total": total_correct + total_incorrect,
             "correctAnswers": total_correct,
             "incorrectAnswers": total_incorrect,
-            "timeTaken": quiz.duration,
-            "timestamp": quiz_attempt.timestamp.isoformat(),
+            "timeTaken": duration,
+            "timestamp": timestamp.isoformat(),
             "chapters": chapter_entries
         })
 
@@ -493,13 +627,15 @@ def get_quiz_history():
             'email': current_user.email,
             'dob':current_user.dob
         },
-        'quizzes': quiz_data
+        'quizzes': quiz_data,
+        'next_cursor': next_cursor
     })
 
 
 
 
 
+
 #ADMIN
 #all routes
 @app.route('/api/users/not_admins', methods=['GET'])
@@ -525,73 +661,152 @@ def delete_user(user_id):
 
 @app.route('/api/user/<int:user_id>/performance', methods=['GET'])
 def get_user_performance(user_id):
-    try:
-        user = User.query.get(user_id)
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-
-        user_quizzes = UserQuiz.query.filter_by(user_id=user_id).all()
-        quizzes_performance = []
-
-        for uq in user_quizzes:
-            quiz = uq.quiz  # use relationship instead of extra query
-
-            responses = UserResponse.query.filter_by(attempt_id=uq.id).all()
-
-            chapter_stats = {}
-            total_correct = 0
-            total_questions = 0
-
-            for response in responses:
-                chapter = response.chapter 
-                if not chapter:
-                    continue
-
-                chapter_name = chapter.name
-                if chapter_name not in chapter_stats:
-                    chapter_stats[chapter_name] = {"easy": [0, 0], "medium": [0, 0], "hard": [0, 0]}
-
-                question = response.question_obj
-                level = question.difficulty
-                correct = 1 if response.user_answer == question.correct_answer else 0
-
-                chapter_stats[chapter_name][level][0] += correct
-                chapter_stats[chapter_name][level][1] += 1
-                total_correct += correct
-                total_questions += 1
-
-            formatted_chapters = []
-            for chapter_name, levels in chapter_stats.items():
-                formatted_chapters.append({
-                    "chapter": chapter_name,
-                    "easy": f"{levels['easy'][0]}/{levels['easy'][1]}",
-                    "medium": f"{levels['medium'][0]}/{levels['medium'][1]}",
-                    "hard": f"{levels['hard'][0]}/{levels['hard'][1]}",
-                })
-
-            quizzes_performance.append({
-                "quiz_id": quiz.id,
-                "remarks": quiz.remarks,
-                "duration": quiz.duration,
-                "score": (total_correct / total_questions) * 100 if total_questions else 0,
-                "chapter_stats": formatted_chapters
+    user = db.session.get(User, user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    header = json.dumps({
+        "user": {
+            "id": user.id,
+            "fullname": user.fullname,
+            "email": user.email,
+            "dob": user.dob
+        }
+    })
+
+    def generate():
+        # Same document as jsonify would produce, written one quiz at a time.
+        yield header[:-1] + ', "quizzes": ['
+        try:
+            for n, quiz in enumerate(iter_quiz_performance(user_id)):
+                yield (', ' if n else '') + json.dumps(quiz)
+        except Exception as e:
+            # The 200 status is already sent, so mark the report as partial in the document itself.
+            print(f"Error streaming performance data: {e}")
+            yield '], "error": "Performance data is incomplete."}'
+            return
+        yield ']}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def iter_quiz_performance(user_id):
+    """
+    Yields one summary per attempt, built from a single query grouped by
+    (attempt, chapter, difficulty) over the stored is_correct flags.
+    """
+    responses = db.session.query(
+        UserResponse.id, UserResponse.attempt_id, UserResponse.chapter_id, Chapters.name.label('chapter_name'),
+        Questions.difficulty, UserResponse.is_correct
+    ).join(Chapters, UserResponse.chapter_id == Chapters.id) \
+        .join(Questions, UserResponse.question_id == Questions.id) \
+        .subquery()
+
+    rows = db.session.query(
+        UserQuiz.id, Quiz.id, Quiz.remarks, Quiz.duration,
+        responses.c.chapter_name, responses.c.difficulty,
+        func.sum(case((responses.c.is_correct, 1), else_=0)), func.count(responses.c.attempt_id)
+    ).join(Quiz, Quiz.id == UserQuiz.quiz_id) \
+        .outerjoin(responses, responses.c.attempt_id == UserQuiz.id) \
+        .filter(UserQuiz.user_id == user_id) \
+        .group_by(UserQuiz.id, responses.c.chapter_id, responses.c.difficulty) \
+        .order_by(UserQuiz.id, func.min(responses.c.id)) \
+        .yield_per(1000)
+
+    def summary(quiz_id, remarks, duration, chapter_stats, total_correct, total_questions):
+        formatted_chapters = []
+        for chapter_name, levels in chapter_stats.items():
+            formatted_chapters.append({
+                "chapter": chapter_name,
+                "easy": f"{levels['easy'][0]}/{levels['easy'][1]}",
+                "medium": f"{levels['medium'][0]}/{levels['medium'][1]}",
+                "hard": f"{levels['hard'][0]}/{levels['hard'][1]}",
             })
+        return {
+            "quiz_id": quiz_id,
+            "remarks": remarks,
+            "duration": duration,
+            "score": (total_correct / total_questions) * 100 if total_questions else 0,
+            "chapter_stats": formatted_chapters
+        }
+
+    current = None
+    for attempt_id, quiz_id, remarks, duration, chapter_name, level, correct, answered in rows:
+        if current is None or current[0] != attempt_id:
+            if current is not None:
+                yield summary(*current[1:])
+            current = [attempt_id, quiz_id, remarks, duration, {}, 0, 0]
+        if chapter_name is None:
+            continue  # attempt without responses
+
+        levels = current[4].setdefault(chapter_name, {"easy": [0, 0], "medium": [0, 0], "hard": [0, 0]})
+        levels[level][0] += correct
+        levels[level][1] += answered
+        current[5] += correct
+        current[6] += answered
+
+    if current is not None:
+        yield summary(*current[1:])
+
+
+
+@app.route('/api/admin/users/bulk', methods=['POST'])
+@admin_required
+def bulk_register():
+    # Roster as a JSON list (or {"users": [...]}), a text/csv body, or an uploaded "roster" file.
+    upload = request.files.get('roster')
+    try:
+        if upload:
+            fmt = 'json' if upload.filename.lower().endswith('.json') else 'csv'
+            roster = read_roster(io.TextIOWrapper(upload.stream, encoding='utf-8'), fmt)
+        elif request.mimetype == 'text/csv':
+            roster = read_roster(io.StringIO(request.get_data(as_text=True)), 'csv')
+        else:
+            data = request.get_json()
+            roster = data.get('users', []) if isinstance(data, dict) else data
+    except (ValueError, UnicodeDecodeError, csv.Error):
+        return jsonify({"success": False, "message": "Could not parse roster"}), 400
+    if not isinstance(roster, list):
+        return jsonify({"success": False, "message": "Roster must be a list of users"}), 400
 
-        return jsonify({
-            "user": {
-                "id": user.id,
-                "fullname": user.fullname,
-                "email": user.email,
-                "dob":user.dob
-            },
-            "quizzes": quizzes_performance
-        })
+    try:
+        result = provision_users(roster, hash_passwords=bulk_password_hasher.hash_many)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error provisioning users: {e}")
+        return jsonify({"success": False, "message": "Provisioning failed"}), 500
 
+    return jsonify({
+        "success": True,
+        "created": len(result['created']),
+        "skipped": result['skipped'],
+        "users": result['created']
+    }), 201
+
+
+@app.route('/api/admin/analytics', methods=['GET'])
+@admin_required
+def get_cohort_analytics():
+    try:
+        report = cohort_analytics.get()
+        if request.args.get('questions', '1') == '0':
+            report = {key: value for key, value in report.items() if key != 'questions'}
+        return jsonify(report), 200
     except Exception as e:
-        print(f"Error fetching performance data: {e}")
+        print(f"Error computing cohort analytics: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    if not instrumentation.enabled:
+        abort(404)
+    token = app.config['METRICS_TOKEN']
+    has_token = bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not has_token and not (current_user.is_authenticated and current_user.is_admin):
+        return jsonify({'error': 'Unauthorized'}), 403
+    return Response(instrumentation.render(), mimetype='text/plain; version=0.0.4')
+
 
 def performance_to_dict(performance):
     return {
@@ -605,5 +820,8 @@ def performance_to_dict(performance):
 
 
 if __name__ == '__main__':
+    from upgrade_db import upgrade
+
     with app.app_context():
+        upgrade()  # create_all, plus columns and indexes added since the database was created
         app.run(host='0.0.0.0', port=5000, debug=True)
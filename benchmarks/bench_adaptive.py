@@ -0,0 +1,179 @@
+"""
+End-to-end benchmark of the adaptive loop with synthetic students.
+
+Every learner has a latent ability per chapter; a question is answered
+correctly with probability sigmoid(ability - difficulty), and abilities grow a
+little with every answered question, most when it was neither too easy nor
+too hard. Each round, every learner takes their current quiz and the real
+grading, mastery, policy and question selection code builds the next one,
+the same steps `build_next_quiz` performs on submit, timed stage by stage.
+
+Run from the repository root (uses a throwaway SQLite database):
+    python -m benchmarks.bench_adaptive --learners 100 --rounds 20
+    python -m benchmarks.bench_adaptive --policy random   # baseline learning curve
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.harness import use_temporary_database, SQLCounter
+
+DIFFICULTY_OFFSET = {'easy': -1.0, 'medium': 0.0, 'hard': 1.0}
+
+
+class SyntheticLearner:
+    def __init__(self, user_id, quiz_id, chapter_ids, rng, learning_rate):
+        self.user_id = user_id
+        self.quiz_id = quiz_id
+        self.ability = {ch_id: rng.gauss(0.0, 1.0) for ch_id in chapter_ids}
+        self.rng = rng
+        self.learning_rate = learning_rate
+
+    def p_correct(self, chapter_id, difficulty):
+        return 1.0 / (1.0 + math.exp(-(self.ability[chapter_id] - DIFFICULTY_OFFSET[difficulty])))
+
+    def answer(self, questions):
+        answers = {}
+        for q in questions:
+            p = self.p_correct(q.chapter_id, q.difficulty)
+            answers[str(q.id)] = q.correct_answer if self.rng.random() < p else 'X'
+            self.ability[q.chapter_id] += self.learning_rate * p * (1.0 - p)
+        return answers
+
+    def expected_accuracy(self):
+        # Expected share correct on medium questions, averaged over chapters.
+        return statistics.mean(self.p_correct(ch_id, 'medium') for ch_id in self.ability)
+
+    def weakest_chapter(self):
+        return min(self.ability, key=self.ability.get)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--learners', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--questions-per-bucket', type=int, default=40)
+    parser.add_argument('--learning-rate', type=float, default=0.05)
+    parser.add_argument('--policy', choices=['dqn', 'random'], default='dqn',
+                        help="Pick the next chapter/difficulty with the trained DQN or uniformly at random.")
+    parser.add_argument('--epsilon', type=float, default=0.0, help="Exploration rate of the DQN policy.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        use_temporary_database(os.path.join(tmp, 'bench.db'))
+        from app import app, db, get_user_performance_state
+        from dqn_agent import DQNPolicy
+        from grading import grade_answers, record_attempt, next_quiz_remarks, create_quiz
+        from irt import get_user_ability
+        from models import QuizQuestion
+        from question_index import load_questions
+        from quiz_env import QuizEnv
+        from quiz_selector import AGENT_WEIGHTS_PATH, select_adaptive_question_ids
+        from benchmarks.seed import seed_database
+
+        rng = random.Random(args.seed)
+        env = QuizEnv()
+        policy = DQNPolicy(AGENT_WEIGHTS_PATH, epsilon=args.epsilon)
+
+        with app.app_context():
+            db.create_all()
+            ids = seed_database(users=args.learners, chapters=env.chapter_count,
+                                questions_per_bucket=args.questions_per_bucket, attempts_per_user=0, seed=args.seed)
+            learners = [SyntheticLearner(user_id, ids['quiz_ids'][user_id][0], ids['chapter_ids'],
+                                         random.Random(rng.random()), args.learning_rate)
+                        for user_id in ids['user_ids']]
+            counter = SQLCounter(db.engine)
+
+            stages = defaultdict(list)
+            curve = []
+            quizzes = 0
+            counter.reset()
+            started = time.perf_counter()
+
+            for round_number in range(1, args.rounds + 1):
+                scores, targeted_weakest = [], 0
+                for learner in learners:
+                    def timed(stage, fn, *fn_args, **fn_kwargs):
+                        t0 = time.perf_counter()
+                        result = fn(*fn_args, **fn_kwargs)
+                        stages[stage].append((time.perf_counter() - t0) * 1000)
+                        return result
+
+                    questions = timed('load', lambda: load_questions([
+                        q_id for (q_id,) in db.session.query(QuizQuestion.question_id)
+                        .filter_by(quiz_id=learner.quiz_id).order_by(QuizQuestion.id)]))
+                    weakest = learner.weakest_chapter()
+                    answers = learner.answer(questions)
+
+                    graded = timed('grade', grade_answers, answers)
+                    timed('record', record_attempt, learner.user_id, learner.quiz_id, graded, 300)
+                    state = timed('state', lambda: get_user_performance_state(learner.user_id)['state'])
+                    if args.policy == 'dqn':
+                        action = timed('act', policy.act, state)
+                    else:
+                        action = timed('act', rng.randrange, env.action_space)
+                    chapter, difficulty = env.decode_action(action)
+                    new_ids = timed('select', lambda: select_adaptive_question_ids(
+                        chapter, difficulty, num_questions=20,
+                        ability=get_user_ability(learner.user_id)))
+                    new_quiz = timed('create', lambda: create_quiz(
+                        learner.user_id, new_ids, duration=10, remarks=next_quiz_remarks(learner.user_id),
+                        selected_chapter=chapter, difficulty=difficulty))
+                    learner.quiz_id = new_quiz.id
+                    timed('commit', db.session.commit)
+
+                    scores.append(graded.score)
+                    targeted_weakest += chapter == weakest
+                    quizzes += 1
+
+                curve.append({
+                    'round': round_number,
+                    'mean_score': statistics.mean(scores),
+                    'expected_accuracy': statistics.mean(l.expected_accuracy() for l in learners),
+                    'weakest_chapter_targeted': targeted_weakest / len(learners)
+                })
+
+            elapsed = time.perf_counter() - started
+            statements = counter.count
+
+        print(f"{quizzes} quizzes in {elapsed:.2f}s: {quizzes / elapsed:,.1f} quizzes/sec, "
+              f"{statements / quizzes:.1f} statements/quiz ({args.policy} policy)")
+        print(f"{'stage':<8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'share':>7}")
+        total_ms = sum(sum(v) for v in stages.values())
+        for stage, values in stages.items():
+            print(f"{stage:<8} {statistics.mean(values):9.3f} {percentile(values, 0.5):9.3f} "
+                  f"{percentile(values, 0.95):9.3f} {sum(values) / total_ms:7.1%}")
+        print(f"{'round':>5} {'score':>7} {'expected':>9} {'weakest':>8}")
+        for point in curve:
+            print(f"{point['round']:>5} {point['mean_score']:7.3f} {point['expected_accuracy']:9.3f} "
+                  f"{point['weakest_chapter_targeted']:8.1%}")
+
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({
+                    'args': vars(args),
+                    'quizzes': quizzes,
+                    'seconds': elapsed,
+                    'quizzes_per_sec': quizzes / elapsed,
+                    'statements_per_quiz': statements / quizzes,
+                    'stages_ms': {stage: {'mean': statistics.mean(v), 'p50': percentile(v, 0.5),
+                                          'p95': percentile(v, 0.95)} for stage, v in stages.items()},
+                    'learning_curve': curve
+                }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Measures GET /api/dashboard: SQL statements and latency per request for the
+original per-chapter implementation, the aggregate queries, and the cached path.
+
+Run from the repository root (uses a throwaway SQLite database):
+    python -m benchmarks.bench_dashboard --users 200 --attempts 50
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.harness import use_temporary_database, SQLCounter
+
+
+def legacy_dashboard(user):
+    # The dashboard as it was before the aggregate rewrite: one Performance query per chapter.
+    from app import (UserQuiz, Chapters, Performance, db, calculate_streak, calculate_xp_level,
+                     calculate_avg_score, calculate_time_spent)
+
+    recent_attempts = UserQuiz.query.filter_by(user_id=user.id).order_by(UserQuiz.timestamp.desc()).limit(5).all()
+    total_chapters = Chapters.query.count()
+    attempted = db.session.query(Performance.chapter_id).filter_by(user_id=user.id).distinct().count()
+    perf = Performance.query.filter_by(user_id=user.id).all()
+    hard = sum(p.hard_correct for p in perf)
+    medium = sum(p.medium_correct for p in perf)
+    easy = sum(p.easy_correct for p in perf)
+    subject_stats = []
+    for ch in Chapters.query.all():
+        ch_perf = Performance.query.filter_by(user_id=user.id, chapter_id=ch.id).first()
+        total_correct = ch_perf.easy_correct + ch_perf.medium_correct + ch_perf.hard_correct if ch_perf else 0
+        subject_stats.append({"name": ch.name, "completion": min(100, total_correct * 10)})
+    return {
+        "streak": calculate_streak(recent_attempts),
+        "xp": calculate_xp_level(recent_attempts),
+        "overallProgress": round(attempted / total_chapters * 100) if total_chapters else 0,
+        "avgScore": calculate_avg_score(recent_attempts),
+        "timeSpent": calculate_time_spent(recent_attempts),
+        "adaptiveLevel": (hard, medium, easy),
+        "subjectStats": subject_stats,
+    }
+
+
+def measure(name, fn, users, counter):
+    latencies = []
+    counter.reset()
+    for user in users:
+        start = time.perf_counter()
+        fn(user)
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(f"{name:<22} {counter.count / len(users):8.1f} statements/req "
+          f"{statistics.mean(latencies):8.2f} ms mean {statistics.quantiles(latencies, n=20)[18]:8.2f} ms p95")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--chapters', type=int, default=30)
+    parser.add_argument('--attempts', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        use_temporary_database(os.path.join(tmp, 'bench.db'))
+        from app import app, build_dashboard, dashboard_cache, db
+        from models import User
+        from benchmarks.seed import seed_database
+
+        with app.app_context():
+            db.create_all()
+            ids = seed_database(users=args.users, chapters=args.chapters, attempts_per_user=args.attempts)
+            users = User.query.filter(User.id.in_(ids['user_ids'])).all()
+            counter = SQLCounter(db.engine)
+
+            def cached(user):
+                dashboard = dashboard_cache.get(user.id)
+                if dashboard is None:
+                    dashboard_cache.set(user.id, build_dashboard(user))
+
+            measure('before (per chapter)', legacy_dashboard, users, counter)
+            measure('after (aggregate)', build_dashboard, users, counter)
+            dashboard_cache.clear()
+            cached_users = users * 5
+            measure('after (cached, 5x)', cached, cached_users, counter)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+HTTP load test of the main student endpoints.
+
+Seeds a throwaway SQLite database, then concurrent workers each log in as
+their own students and loop through /login, /api/dashboard, /api/quiz/<id>,
+/api/quiz/<id>/submit and /quiz-history, either through Flask's test client
+or against a local threaded WSGI server. Reports throughput, p50/p95/p99
+latency and SQL statements per request for every endpoint.
+
+Run from the repository root:
+    python -m benchmarks.bench_http --workers 8 --iterations 20 --json results.json
+    python -m benchmarks.bench_http --server --compare results.json
+"""
+import argparse
+import http.cookiejar
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+from benchmarks.harness import use_temporary_database, SQLCounter
+
+STATEMENTS_HEADER = 'X-SQL-Statements'
+ENDPOINTS = ['POST /login', 'GET /api/dashboard', 'GET /api/quiz/<id>', 'POST /api/quiz/<id>/submit',
+             'GET /quiz-history']
+
+
+class StatementCountMiddleware:
+    """
+    Adds the number of SQL statements a request executed as a response header.
+    The body is buffered so statements run while producing it are counted too.
+    """
+
+    def __init__(self, wsgi_app, counter):
+        self.wsgi_app = wsgi_app
+        self.counter = counter
+
+    def __call__(self, environ, start_response):
+        self.counter.reset_thread()
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured['status'], captured['headers'] = status, headers
+            return lambda data: None
+
+        result = self.wsgi_app(environ, capture)
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        start_response(captured['status'],
+                       captured['headers'] + [(STATEMENTS_HEADER, str(self.counter.thread_count))])
+        return [body]
+
+
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, payload=None):
+        response = self.client.open(path, method=method, json=payload)
+        return response.status_code, response.headers.get(STATEMENTS_HEADER), response.get_json(silent=True)
+
+
+class HTTPSession:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'} if data else {})
+        try:
+            with self.opener.open(req) as response:
+                status, headers, body = response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            status, headers, body = e.code, e.headers, e.read()
+        try:
+            body = json.loads(body)
+        except ValueError:
+            body = None
+        return status, headers.get(STATEMENTS_HEADER), body
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)  # endpoint -> [(latency ms, statements, ok)]
+        self._lock = threading.Lock()
+
+    def call(self, session, endpoint, method, path, payload=None):
+        start = time.perf_counter()
+        status, statements, body = session.request(method, path, payload)
+        latency = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.samples[endpoint].append((latency, int(statements) if statements else 0, 200 <= status < 300))
+        return status, body
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_worker(make_session, recorder, students, iterations, errors):
+    try:
+        for i in range(iterations):
+            student = students[i % len(students)]
+            session = make_session()
+            recorder.call(session, 'POST /login', 'POST', '/login',
+                          {'email': student['email'], 'password': student['password']})
+            recorder.call(session, 'GET /api/dashboard', 'GET', '/api/dashboard')
+            status, quiz = recorder.call(session, 'GET /api/quiz/<id>', 'GET', f"/api/quiz/{student['quiz_id']}")
+            answers = {str(q['id']): 'A' for q in (quiz or {}).get('questions', [])}
+            status, result = recorder.call(session, 'POST /api/quiz/<id>/submit', 'POST',
+                                           f"/api/quiz/{student['quiz_id']}/submit",
+                                           {'answers': answers, 'time_taken': 300, 'async': False})
+            if status == 200 and result.get('new_quiz_id'):
+                student['quiz_id'] = result['new_quiz_id']
+            recorder.call(session, 'GET /quiz-history', 'GET', '/quiz-history')
+    except Exception as e:
+        errors.append(repr(e))
+
+
+def summarize(recorder, elapsed):
+    results = {}
+    for endpoint in ENDPOINTS:
+        samples = recorder.samples.get(endpoint)
+        if not samples:
+            continue
+        latencies = [s[0] for s in samples]
+        results[endpoint] = {
+            'requests': len(samples),
+            'errors': sum(1 for s in samples if not s[2]),
+            'throughput': len(samples) / elapsed,
+            'mean_ms': statistics.mean(latencies),
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'statements': statistics.mean(s[1] for s in samples)
+        }
+    return results
+
+
+def print_results(results, baseline=None):
+    print(f"{'endpoint':<30} {'reqs':>6} {'errs':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'stmts':>6}")
+    for endpoint, r in results.items():
+        print(f"{endpoint:<30} {r['requests']:>6} {r['errors']:>5} {r['throughput']:8.1f} {r['p50_ms']:8.2f} "
+              f"{r['p95_ms']:8.2f} {r['p99_ms']:8.2f} {r['statements']:6.1f}")
+        old = (baseline or {}).get(endpoint)
+        if old:
+            print(f"{'  vs. baseline':<30} {'':>6} {r['errors'] - old['errors']:>+5} "
+                  f"{r['throughput'] - old['throughput']:>+8.1f} {r['p50_ms'] - old['p50_ms']:>+8.2f} "
+                  f"{r['p95_ms'] - old['p95_ms']:>+8.2f} {r['p99_ms'] - old['p99_ms']:>+8.2f} "
+                  f"{r['statements'] - old['statements']:>+6.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--chapters', type=int, default=6)
+    parser.add_argument('--questions-per-bucket', type=int, default=40)
+    parser.add_argument('--attempts', type=int, default=20, help="Seeded attempts per user.")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=20, help="Login-to-history loops per worker.")
+    parser.add_argument('--server', action='store_true',
+                        help="Send real HTTP requests to a local threaded WSGI server instead of the test client.")
+    parser.add_argument('--json', help="Write the results to this file.")
+    parser.add_argument('--compare', help="Print differences against a previous --json file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        use_temporary_database(os.path.join(tmp, 'bench.db'))
+        from app import app, db
+        from benchmarks.seed import seed_database, BENCH_PASSWORD
+
+        with app.app_context():
+            db.create_all()
+            ids = seed_database(users=args.users, chapters=args.chapters,
+                                questions_per_bucket=args.questions_per_bucket, attempts_per_user=args.attempts)
+            counter = SQLCounter(db.engine)
+
+        # Each worker gets its own students so no two workers submit the same quiz.
+        students = [{'email': f'bench{user_id}@example.com', 'password': BENCH_PASSWORD,
+                     'quiz_id': ids['quiz_ids'][user_id][-1]} for user_id in ids['user_ids']]
+        workers = min(args.workers, len(students))
+        app.wsgi_app = StatementCountMiddleware(app.wsgi_app, counter)
+
+        server = None
+        if args.server:
+            from werkzeug.serving import make_server
+            logging.getLogger('werkzeug').setLevel(logging.WARNING)
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f'http://127.0.0.1:{server.server_port}'
+            make_session = lambda: HTTPSession(base_url)
+        else:
+            make_session = lambda: TestClientSession(app)
+
+        recorder, errors = Recorder(), []
+        threads = [threading.Thread(target=run_worker,
+                                    args=(make_session, recorder, students[w::workers], args.iterations, errors))
+                   for w in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        if server is not None:
+            server.shutdown()
+
+    results = summarize(recorder, elapsed)
+    print(f"{workers} workers x {args.iterations} iterations via {'HTTP server' if args.server else 'test client'} "
+          f"in {elapsed:.2f}s")
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['endpoints']
+    print_results(results, baseline)
+    for error in errors:
+        print(f"[ERROR] worker failed: {error}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'seconds': elapsed, 'endpoints': results, 'worker_errors': errors},
+                      f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
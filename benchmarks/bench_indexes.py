@@ -0,0 +1,112 @@
+"""
+Query plans and latency of the hot lookups with and without the indexes
+declared in models.py, on a seeded database (about 1M responses by default).
+
+The database is seeded, the indexes are dropped to reproduce an old database,
+every query is measured, then upgrade_db.upgrade() adds the indexes back and
+the queries are measured again.
+
+Run from the repository root (uses a throwaway SQLite database):
+    python -m benchmarks.bench_indexes --users 2500 --attempts 20
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import text
+
+from benchmarks.harness import use_temporary_database
+
+QUERIES = {
+    'history page': (
+        "SELECT user_quiz.id, user_quiz.score, user_quiz.timestamp, quiz.remarks FROM user_quiz "
+        "JOIN quiz ON quiz.id = user_quiz.quiz_id WHERE user_quiz.user_id = :user_id "
+        "ORDER BY user_quiz.timestamp DESC, user_quiz.id DESC LIMIT 21"),
+    'history breakdown': (
+        "SELECT user_response.attempt_id, questions.chapter_id, questions.difficulty, count(*) FROM user_response "
+        "JOIN questions ON questions.id = user_response.question_id "
+        "WHERE user_response.attempt_id IN (SELECT id FROM user_quiz WHERE user_id = :user_id) "
+        "GROUP BY user_response.attempt_id, questions.chapter_id, questions.difficulty"),
+    'quiz questions': (
+        "SELECT questions.* FROM quiz_question JOIN questions ON questions.id = quiz_question.question_id "
+        "WHERE quiz_question.quiz_id = :quiz_id"),
+    'question bucket': (
+        "SELECT id FROM questions WHERE chapter_id = :chapter_id AND difficulty = 'medium'"),
+    'chapter performance': (
+        "SELECT * FROM performance WHERE user_id = :user_id AND chapter_id = :chapter_id"),
+    'quiz count': (
+        "SELECT count(*) FROM quiz WHERE user_id = :user_id"),
+}
+
+
+def measure(session, params, repeat):
+    results = {}
+    for name, sql in QUERIES.items():
+        plan = [row[-1] for row in session.execute(text('EXPLAIN QUERY PLAN ' + sql), params[0])]
+        latencies = []
+        for p in params[:repeat]:
+            start = time.perf_counter()
+            session.execute(text(sql), p).all()
+            latencies.append((time.perf_counter() - start) * 1000)
+        results[name] = (plan, statistics.mean(latencies))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2500)
+    parser.add_argument('--chapters', type=int, default=6)
+    parser.add_argument('--attempts', type=int, default=20)
+    parser.add_argument('--answers', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=200, help="Executions of each query per measurement.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        use_temporary_database(os.path.join(tmp, 'bench.db'))
+        from app import app, db
+        from upgrade_db import upgrade
+        from benchmarks.seed import seed_database
+
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            ids = seed_database(users=args.users, chapters=args.chapters, attempts_per_user=args.attempts,
+                                answers_per_attempt=args.answers)
+            print(f"Seeded {args.users * args.attempts * args.answers:,} responses "
+                  f"in {time.perf_counter() - started:.1f}s")
+
+            rng = random.Random(0)
+            params = []
+            for _ in range(args.repeat):
+                user_id = rng.choice(ids['user_ids'])
+                params.append({'user_id': user_id, 'quiz_id': rng.choice(ids['quiz_ids'][user_id]),
+                               'chapter_id': rng.choice(ids['chapter_ids'])})
+
+            index_names = [index.name for table in db.metadata.sorted_tables for index in table.indexes
+                           if not index.unique]
+            with db.engine.begin() as conn:
+                for name in index_names:
+                    conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+                conn.execute(text('ANALYZE'))
+            before = measure(db.session, params, args.repeat)
+            db.session.commit()
+
+            started = time.perf_counter()
+            upgrade()
+            print(f"upgrade_db added the indexes in {time.perf_counter() - started:.1f}s")
+            after = measure(db.session, params, args.repeat)
+
+    for name in QUERIES:
+        (plan_before, ms_before), (plan_after, ms_after) = before[name], after[name]
+        print(f"\n{name}: {ms_before:.3f} ms -> {ms_after:.3f} ms ({ms_before / ms_after:.0f}x)")
+        for line in plan_before:
+            print(f"  before: {line}")
+        for line in plan_after:
+            print(f"  after:  {line}")
+
+
+if __name__ == '__main__':
+    main()
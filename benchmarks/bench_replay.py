@@ -0,0 +1,87 @@
+"""
+Compares DQNAgent.replay (batched, target network, array-backed buffer)
+against the original per-transition replay loop over a deque of tuples.
+
+Run from the repository root:
+    python -m benchmarks.bench_replay --steps 200
+"""
+import argparse
+import random
+import time
+from collections import deque
+
+import numpy as np
+import torch
+
+from dqn_agent import DQNAgent
+
+
+def legacy_replay(agent, batch_size=32):
+    # The pre-batching implementation: one forward/backward/step per transition.
+    if len(agent.legacy_memory) < batch_size:
+        return
+
+    batch = random.sample(agent.legacy_memory, batch_size)
+    for state, action, reward, next_state in batch:
+        state_tensor = torch.FloatTensor(state)
+        target = reward
+        if next_state is not None:
+            target = reward + agent.gamma * torch.max(agent.model(torch.FloatTensor(next_state)))
+
+        current_qs = agent.model(state_tensor)
+        target_qs = current_qs.clone().detach()
+        target_qs[action] = target
+
+        loss = agent.criterion(current_qs, target_qs)
+
+        agent.optimizer.zero_grad()
+        loss.backward()
+        agent.optimizer.step()
+
+    if agent.epsilon > agent.epsilon_min:
+        agent.epsilon *= agent.epsilon_decay
+
+
+def fill_memory(agent, rng):
+    agent.legacy_memory = deque(maxlen=agent.memory.capacity)
+    for _ in range(agent.memory.capacity):
+        state = rng.random(agent.state_size)
+        next_state = None if rng.random() < 0.1 else rng.random(agent.state_size)
+        transition = (state, int(rng.integers(agent.action_size)), float(rng.choice([-1, 1])), next_state)
+        agent.remember(*transition)
+        agent.legacy_memory.append(transition)
+
+
+def run(replay_fn, steps, batch_size, seed, prioritized=False):
+    torch.manual_seed(seed)
+    agent = DQNAgent(state_size=18, action_size=18, prioritized=prioritized)
+    fill_memory(agent, np.random.default_rng(seed))
+
+    replay_fn(agent, batch_size)  # warm-up
+    start = time.perf_counter()
+    for _ in range(steps):
+        replay_fn(agent, batch_size)
+    elapsed = time.perf_counter() - start
+    return steps * batch_size / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    legacy = run(legacy_replay, args.steps, args.batch_size, args.seed)
+    batched = run(lambda agent, batch_size: agent.replay(batch_size), args.steps, args.batch_size, args.seed)
+    prioritized = run(lambda agent, batch_size: agent.replay(batch_size), args.steps, args.batch_size, args.seed,
+                      prioritized=True)
+
+    print(f"per-sample replay:  {legacy:12.0f} transitions/sec")
+    print(f"batched replay:     {batched:12.0f} transitions/sec")
+    print(f"prioritized replay: {prioritized:12.0f} transitions/sec")
+    print(f"speed-up:           {batched / legacy:12.1f}x")
+
+
+if __name__ == '__main__':
+    main()
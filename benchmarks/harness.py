@@ -0,0 +1,46 @@
+"""
+Shared helpers for the benchmarks.
+"""
+import os
+import sys
+import threading
+
+from sqlalchemy import event
+
+
+def use_temporary_database(path):
+    """
+    Points the app at a throwaway SQLite file. Must be called before `app` is imported.
+    """
+    if 'app' in sys.modules:
+        raise RuntimeError("use_temporary_database() must run before the app module is imported")
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(path)
+
+
+class SQLCounter:
+    """
+    Counts statements executed on an engine, overall and per thread.
+    """
+
+    def __init__(self, engine):
+        self.count = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.count += 1
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+        self._local.count = 0
+
+    @property
+    def thread_count(self):
+        return getattr(self._local, 'count', 0)
+
+    def reset_thread(self):
+        self._local.count = 0
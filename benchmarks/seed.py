@@ -0,0 +1,131 @@
+"""
+Populates a database with synthetic users, chapters, questions and quiz
+history for the benchmarks. All rows are written with chunked bulk inserts.
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from extensions import db
+from models import User, Chapters, Questions, Quiz, QuizQuestion, UserQuiz, UserResponse, Performance
+from mastery import DIFFICULTIES, rebuild_mastery
+
+BENCH_PASSWORD = 'bench-password'
+OPTIONS = ['A', 'B', 'C', 'D']
+
+
+def _bulk_insert(model, rows, chunk_size=50000):
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(insert(model), rows[start:start + chunk_size])
+
+
+def _flush_full(model, rows, chunk_size=50000):
+    # Keeps memory flat for large seeds; SQLite does not enforce foreign keys by default.
+    if len(rows) >= chunk_size:
+        _bulk_insert(model, rows, chunk_size)
+        rows.clear()
+
+
+def _next_id(model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def seed_database(users=50, chapters=6, questions_per_bucket=20, attempts_per_user=10,
+                  answers_per_attempt=20, seed=0):
+    """
+    Adds synthetic data next to whatever the database already holds and returns
+    the ids it created. Users get the password `BENCH_PASSWORD` and emails
+    `bench<N>@example.com`. Must run inside an app context; commits at the end.
+    """
+    rng = random.Random(seed)
+    password = generate_password_hash(BENCH_PASSWORD)
+
+    chapter_start = _next_id(Chapters)
+    chapter_ids = list(range(chapter_start, chapter_start + chapters))
+    _bulk_insert(Chapters, [{
+        'id': ch_id, 'name': f'Bench chapter {ch_id}', 'description': 'Synthetic chapter'
+    } for ch_id in chapter_ids])
+
+    question_id = _next_id(Questions)
+    questions = []
+    for ch_id in chapter_ids:
+        for difficulty in DIFFICULTIES:
+            for n in range(questions_per_bucket):
+                questions.append({
+                    'id': question_id, 'chapter_id': ch_id, 'difficulty': difficulty,
+                    'question': f'Chapter {ch_id} {difficulty} question {n}?',
+                    'option_a': 'A', 'option_b': 'B', 'option_c': 'C', 'option_d': 'D',
+                    'correct_answer': rng.choice(OPTIONS)
+                })
+                question_id += 1
+    _bulk_insert(Questions, questions)
+
+    user_start = _next_id(User)
+    user_ids = list(range(user_start, user_start + users))
+    _bulk_insert(User, [{
+        'id': user_id, 'email': f'bench{user_id}@example.com', 'password': password,
+        'fullname': f'Bench User {user_id}', 'dob': '2008-01-01', 'is_admin': False
+    } for user_id in user_ids])
+
+    quiz_id = _next_id(Quiz)
+    attempt_id = _next_id(UserQuiz)
+    quiz_ids = {}
+    quizzes, quiz_questions, attempts, responses, performances = [], [], [], [], []
+    start_time = datetime.now() - timedelta(days=attempts_per_user)
+
+    for user_id in user_ids:
+        ability = rng.uniform(0.3, 0.9)
+        for n in range(attempts_per_user + 1):
+            picked = rng.sample(questions, min(answers_per_attempt, len(questions)))
+            # Later quizzes record the first question's bucket as the agent's action.
+            action = (None, None) if n == 0 or not picked else (picked[0]['chapter_id'], picked[0]['difficulty'])
+            quizzes.append({'id': quiz_id, 'user_id': user_id, 'duration': 10,
+                            'remarks': 'First Step' if n == 0 else f'Next Step {n}',
+                            'selected_chapter': action[0], 'difficulty': action[1]})
+            quiz_questions.extend({'quiz_id': quiz_id, 'question_id': q['id']} for q in picked)
+            quiz_ids.setdefault(user_id, []).append(quiz_id)
+
+            # The last quiz of every user is left unattempted.
+            if n < attempts_per_user:
+                per_chapter = {}
+                correct_count = 0
+                for q in picked:
+                    is_correct = rng.random() < ability
+                    correct_count += is_correct
+                    responses.append({
+                        'attempt_id': attempt_id, 'question_id': q['id'], 'chapter_id': q['chapter_id'],
+                        'user_answer': q['correct_answer'] if is_correct else 'X', 'is_correct': is_correct
+                    })
+                    counts = per_chapter.setdefault(q['chapter_id'], {})
+                    counts[q['difficulty'] + '_total'] = counts.get(q['difficulty'] + '_total', 0) + 1
+                    counts[q['difficulty'] + '_correct'] = counts.get(q['difficulty'] + '_correct', 0) + is_correct
+                for ch_id, counts in per_chapter.items():
+                    row = {'user_id': user_id, 'chapter_id': ch_id, 'quiz_id': quiz_id}
+                    for difficulty in DIFFICULTIES:
+                        row[f'{difficulty}_correct'] = counts.get(f'{difficulty}_correct', 0)
+                        row[f'{difficulty}_total'] = counts.get(f'{difficulty}_total', 0)
+                    performances.append(row)
+                attempts.append({
+                    'id': attempt_id, 'user_id': user_id, 'quiz_id': quiz_id,
+                    'score': correct_count / len(picked) if picked else 0.0,
+                    'time_taken': rng.uniform(120, 600),
+                    'timestamp': start_time + timedelta(days=n, minutes=rng.randint(0, 600))
+                })
+                attempt_id += 1
+            quiz_id += 1
+
+        for model, rows in ((Quiz, quizzes), (QuizQuestion, quiz_questions), (UserQuiz, attempts),
+                            (UserResponse, responses), (Performance, performances)):
+            _flush_full(model, rows)
+
+    _bulk_insert(Quiz, quizzes)
+    _bulk_insert(QuizQuestion, quiz_questions)
+    _bulk_insert(UserQuiz, attempts)
+    _bulk_insert(UserResponse, responses)
+    _bulk_insert(Performance, performances)
+    rebuild_mastery()
+    db.session.commit()
+
+    return {'user_ids': user_ids, 'chapter_ids': chapter_ids, 'quiz_ids': quiz_ids}
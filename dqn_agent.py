@@ -2,8 +2,12 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 import random
+import os
+import threading
 import numpy as np
-from collections import deque
+from replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
+from quiz_env import QuizEnv
+from instrumentation import instrumentation
 
 class DQN(nn.Module):
     def __init__(self, state_size, action_size):
@@ -17,20 +21,49 @@ class DQN(nn.Module):
         x = torch.relu(self.fc2(x))
         return self.out(x)
 
+    def forward_sparse(self, rows, indices, values, batch_size, actions=None):
+        """
+        Same Q-values as forward() for states given by their non-zero entries
+        (state `rows[i]` has `values[i]` at `indices[i]`): fc1 is applied as an
+        embedding lookup over those columns only, and only the `actions`
+        outputs are computed, so the cost grows with the non-zero entries and
+        candidate actions rather than the state size.
+        """
+        hidden = self.fc1.weight[:, indices] * values
+        x = torch.zeros(batch_size, self.fc1.out_features).index_add_(0, rows, hidden.t()) + self.fc1.bias
+        x = torch.relu(x)
+        x = torch.relu(self.fc2(x))
+        if actions is None:
+            return self.out(x)
+        return nn.functional.linear(x, self.out.weight[actions], self.out.bias[actions])
+
 
 class DQNAgent:
-    def __init__(self, state_size, action_size):
+    def __init__(self, state_size, action_size, target_update_freq=100, memory_size=1000, prioritized=False, env=None):
         self.state_size = state_size
         self.action_size = action_size
-        self.memory = deque(maxlen=1000)
+        self.env = env or QuizEnv(chapter_count=action_size // 3)
+        self.prioritized = prioritized
+        if prioritized:
+            self.memory = PrioritizedReplayBuffer(memory_size, state_size)
+        else:
+            self.memory = ReplayBuffer(memory_size, state_size)
         self.gamma = 0.95
         self.epsilon = 1.0
         self.epsilon_decay = 0.995
         self.epsilon_min = 0.01
         self.model = DQN(state_size, action_size)
+        self.target_model = DQN(state_size, action_size)
+        self.target_update_freq = target_update_freq
+        self.train_steps = 0
+        self.update_target()
         self.optimizer = optim.Adam(self.model.parameters(), lr=0.001)
         self.criterion = nn.MSELoss()
 
+    def update_target(self):
+        self.target_model.load_state_dict(self.model.state_dict())
+        self.target_model.eval()
+
     def act(self, state):
         if np.random.rand() < self.epsilon:
             return random.randint(0, self.action_size - 1)
@@ -40,32 +73,45 @@ class DQNAgent:
         return torch.argmax(q_values[0]).item()
 
     def remember(self, state, action, reward, next_state):
-        self.memory.append((state, action, reward, next_state))
+        self.memory.push(state, action, reward, next_state)
 
     def replay(self, batch_size=32):
         if len(self.memory) < batch_size:
             return
 
-        batch = random.sample(self.memory, batch_size)
-        for state, action, reward, next_state in batch:
-            state_tensor = torch.FloatTensor(state)
-            target = reward
-            if next_state is not None:
-                target = reward + self.gamma * torch.max(self.model(torch.FloatTensor(next_state)))
+        batch = self.memory.sample(batch_size)
+        states = torch.from_numpy(batch['states'])
+        actions = torch.from_numpy(batch['actions'])
+        rewards = torch.from_numpy(batch['rewards'])
+        next_states = torch.from_numpy(batch['next_states'])
+        # Terminal transitions (next_state=None) are stored with done=1 and do not bootstrap.
+        dones = torch.from_numpy(batch['dones'])
 
-            current_qs = self.model(state_tensor)
-            target_qs = current_qs.clone().detach()
-            target_qs[action] = target
+        with torch.no_grad():
+            next_q = self.target_model(next_states).max(dim=1).values
+        targets = rewards + self.gamma * next_q * (1.0 - dones)
 
-            loss = self.criterion(current_qs, target_qs)
+        current_q = self.model(states).gather(1, actions.unsqueeze(1)).squeeze(1)
+        if batch['weights'] is not None:
+            td_errors = current_q - targets
+            loss = (torch.from_numpy(batch['weights']) * td_errors.pow(2)).mean()
+            self.memory.update_priorities(batch['indices'], td_errors.detach().numpy())
+        else:
+            loss = self.criterion(current_q, targets)
 
-            self.optimizer.zero_grad()
-            loss.backward()
-            self.optimizer.step()
+        self.optimizer.zero_grad()
+        loss.backward()
+        self.optimizer.step()
+
+        self.train_steps += 1
+        if self.train_steps % self.target_update_freq == 0:
+            self.update_target()
 
         if self.epsilon > self.epsilon_min:
             self.epsilon *= self.epsilon_decay
 
+        return loss.item()
+
     def compute_reward(self, performance_map, action):
         """
         Custom reward function to focus on weak areas.
@@ -84,9 +130,7 @@ class DQNAgent:
         return reward
 
     def decode_action(self, action):
-        chapter = action // 3 + 1
-        difficulty = ['easy', 'medium', 'hard'][action % 3]
-        return chapter, difficulty
+        return self.env.decode_action(action)
 
     def save(self, path='dqn_model.pth'):
         torch.save(self.model.state_dict(), path)
@@ -95,6 +139,173 @@ class DQNAgent:
         try:
             self.model.load_state_dict(torch.load(path))
             self.model.eval()
+            self.update_target()
             print("[INFO] DQN model loaded.")
         except FileNotFoundError:
             print("[INFO] No existing DQN model found, starting fresh.")
+        except RuntimeError as e:
+            # Weights trained for a different number of chapters.
+            print(f"[INFO] Existing DQN model does not fit this action space, starting fresh: {e}")
+
+
+class DQNPolicy:
+    """
+    Inference-only view of a trained DQN: no optimizer, no replay memory,
+    model kept in eval mode. Reloads the weights when the file on disk changes;
+    a file that cannot be loaded, or was trained for a different chapter
+    catalog, is skipped and the previously loaded weights stay in use. Until
+    any weights that fit the action space are loaded, every pick is a
+    uniformly random valid action rather than the argmax of an arbitrary
+    untrained network.
+    """
+
+    def __init__(self, path, state_size=18, action_size=18, epsilon=0.0):
+        self.path = path
+        self.state_size = state_size
+        self.action_size = action_size
+        self.epsilon = epsilon
+        self.model = DQN(state_size, action_size)
+        self.model.eval()
+        self.trained = False
+        self.version = 0
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def refresh(self):
+        mtime = self._current_mtime()
+        if mtime == self._mtime:
+            return False
+
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            if mtime is not None:
+                model = DQN(self.state_size, self.action_size)
+                try:
+                    state_dict = torch.load(self.path, map_location='cpu')
+                except Exception as e:
+                    # Usually a checkpoint that is still being written; keep serving the old one.
+                    print(f"[WARN] Could not reload DQN policy from {self.path}: {e}")
+                    return False
+                try:
+                    model.load_state_dict(state_dict)
+                    model.eval()
+                    self.model = model
+                    self.trained = True
+                    print(f"[INFO] DQN policy loaded from {self.path}.")
+                except RuntimeError as e:
+                    # Trained for a different chapter catalog; not retried until the file changes.
+                    fallback = "the previously loaded policy" if self.trained else "random valid actions"
+                    print(f"[WARN] DQN policy in {self.path} does not fit {self.action_size} actions, serving "
+                          f"{fallback} until it is retrained with train_dqn.py: {e}")
+            self._mtime = mtime
+            self.version += 1
+        return True
+
+    def _candidates(self, valid_actions):
+        # None means every action; an empty or out-of-range mask falls back to every action too.
+        if valid_actions is None:
+            return None
+        candidates = np.asarray(valid_actions, dtype=np.int64)
+        candidates = candidates[(candidates >= 0) & (candidates < self.action_size)]
+        return candidates if len(candidates) else None
+
+    def _untrained_q_values(self, batch_size, candidates):
+        # Random scores, so the argmax is a uniformly random candidate and the ranking a random order.
+        return torch.rand(batch_size, self.action_size if candidates is None else len(candidates))
+
+    def _forward(self, states, candidates):
+        """
+        Q-values of the candidate actions (all when None) for a batch of dense
+        states, or of sparse (actions, values) states as built by QuizEnv.to_sparse.
+        """
+        if not self.trained:
+            return self._untrained_q_values(len(states), candidates)
+        if len(states) and isinstance(states[0], tuple):
+            rows = np.repeat(np.arange(len(states)), [len(indices) for indices, _ in states])
+            indices = np.concatenate([np.asarray(indices, dtype=np.int64) for indices, _ in states])
+            values = np.concatenate([np.asarray(values, dtype=np.float32) for _, values in states])
+            return self._forward_sparse(rows, indices, values, len(states), candidates)
+        states_tensor = torch.as_tensor(np.asarray(states, dtype=np.float32))
+        with torch.inference_mode(), instrumentation.stage('torch_inference'):
+            q_values = self.model(states_tensor)
+            return q_values if candidates is None else q_values[:, torch.from_numpy(candidates)]
+
+    def _forward_sparse(self, rows, indices, values, batch_size, candidates):
+        if not self.trained:
+            return self._untrained_q_values(batch_size, candidates)
+        with torch.inference_mode(), instrumentation.stage('torch_inference'):
+            return self.model.forward_sparse(
+                torch.as_tensor(rows, dtype=torch.long), torch.as_tensor(indices, dtype=torch.long),
+                torch.as_tensor(values, dtype=torch.float32), batch_size,
+                None if candidates is None else torch.from_numpy(candidates))
+
+    def _pick(self, q_values, candidates):
+        actions = torch.argmax(q_values, dim=1).numpy()
+        if candidates is not None:
+            actions = candidates[actions]
+        if self.epsilon:
+            explore = np.random.rand(len(actions)) < self.epsilon
+            choices = np.arange(self.action_size) if candidates is None else candidates
+            actions[explore] = np.random.choice(choices, explore.sum())
+        return actions.tolist()
+
+    def q_values(self, state):
+        self.refresh()
+        return self._forward([state], None)[0]
+
+    def act(self, state, valid_actions=None):
+        return self.act_batch([state], valid_actions)[0]
+
+    def act_batch(self, states, valid_actions=None):
+        """
+        Greedy actions for dense or sparse states, restricted to `valid_actions` when given.
+        """
+        self.refresh()
+        candidates = self._candidates(valid_actions)
+        return self._pick(self._forward(states, candidates), candidates)
+
+    def act_sparse(self, rows, indices, values, batch_size, valid_actions=None):
+        """
+        act_batch for a whole batch of sparse states as (rows, indices, values)
+        arrays, e.g. from QuizEnv.sparse_states.
+        """
+        self.refresh()
+        candidates = self._candidates(valid_actions)
+        return self._pick(self._forward_sparse(rows, indices, values, batch_size, candidates), candidates)
+
+    def ranked_actions(self, state, valid_actions=None, k=None):
+        """
+        The `k` best actions (all when None) among `valid_actions`, best first.
+        """
+        self.refresh()
+        candidates = self._candidates(valid_actions)
+        q_values = self._forward([state], candidates)[0]
+        order = torch.topk(q_values, len(q_values) if k is None else min(k, len(q_values))).indices.numpy()
+        return (order if candidates is None else candidates[order]).tolist()
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+def get_policy(path, state_size=18, action_size=18):
+    """
+    Process-wide shared policy for `path`, built on first use.
+    """
+    key = (os.path.abspath(path), state_size, action_size)
+    policy = _policies.get(key)
+    if policy is None:
+        with _policies_lock:
+            policy = _policies.get(key)
+            if policy is None:
+                policy = DQNPolicy(path, state_size=state_size, action_size=action_size)
+                _policies[key] = policy
+    return policy
@@ -1,3 +1,26 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
 db = SQLAlchemy()
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the single
+# writer; synchronous=NORMAL is durable in WAL mode except for the last commits on
+# power loss; cache_size is in KiB when negative.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+}
+
+
+def configure_sqlite(engine, pragmas=SQLITE_PRAGMAS):
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
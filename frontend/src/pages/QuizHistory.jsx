@@ -15,6 +15,8 @@ function QuizHistory() {
   const [user, setUser] = useState(null);
   const [showModal, setShowModal] = useState(false);
   const [selectedQuiz, setSelectedQuiz] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const navigate = useNavigate();
 
@@ -24,6 +26,7 @@ function QuizHistory() {
       .then((res) => {
         setUser(res.data.user);
         setQuizHistory(res.data.quizzes);
+        setNextCursor(res.data.next_cursor);
         setLoading(false);
       })
       .catch((err) => {
@@ -33,6 +36,21 @@ function QuizHistory() {
       });
   }, []);
 
+  const handleLoadMore = () => {
+    setLoadingMore(true);
+    axios
+      .get("http://localhost:5000/quiz-history", { params: { cursor: nextCursor }, withCredentials: true })
+      .then((res) => {
+        setQuizHistory((previous) => [...previous, ...res.data.quizzes]);
+        setNextCursor(res.data.next_cursor);
+      })
+      .catch((err) => {
+        console.error("Failed to load more quiz history.", err);
+        alert("An error occurred while fetching quiz history. Please try again.");
+      })
+      .finally(() => setLoadingMore(false));
+  };
+
   const handleLogout = async () => {
     try {
       await axios.post("http://localhost:5000/api/logout", {}, { withCredentials: true });
@@ -196,6 +214,13 @@ function QuizHistory() {
                 </Card.Body>
               </Card>
             ))}
+            {nextCursor && (
+              <div className="text-center mb-4">
+                <Button variant="outline-primary" onClick={handleLoadMore} disabled={loadingMore}>
+                  {loadingMore ? "Loading..." : "Load more"}
+                </Button>
+              </div>
+            )}
           </div>
         )}
       </Container>
@@ -0,0 +1,117 @@
+from sqlalchemy import insert
+
+from extensions import db
+from models import Questions, UserQuiz, UserResponse, Performance, Quiz, QuizQuestion
+from mastery import DIFFICULTIES, update_mastery
+
+
+class GradedSubmission:
+    def __init__(self, responses, performance_map, difficulty_count, correct_answers, total_questions):
+        self.responses = responses
+        self.performance_map = performance_map  # { chapter_id: { difficulty: correct } }
+        self.difficulty_count = difficulty_count  # { (chapter_id, difficulty): answered }
+        self.correct_answers = correct_answers
+        self.total_questions = total_questions
+
+    @property
+    def score(self):
+        return self.correct_answers / self.total_questions if self.total_questions > 0 else 0.0
+
+
+def grade_answers(user_answers):
+    """
+    Grades { question_id: selected_option } against the answer key, loading
+    every answered question with one IN query. Unknown question ids are not
+    graded but still count towards the total.
+    """
+    answers = {int(q_id): user_ans for q_id, user_ans in user_answers.items()}
+    rows = db.session.query(
+        Questions.id, Questions.chapter_id, Questions.difficulty, Questions.correct_answer
+    ).filter(Questions.id.in_(list(answers))).all() if answers else []
+    questions = {row.id: row for row in rows}
+
+    responses = []
+    performance_map = {}
+    difficulty_count = {}
+    correct_answers = 0
+
+    for q_id, user_ans in answers.items():
+        question = questions.get(q_id)
+        if not question:
+            continue
+        is_correct = question.correct_answer == user_ans
+
+        responses.append({
+            'question_id': q_id,
+            'user_answer': user_ans,
+            'is_correct': is_correct,
+            'chapter_id': question.chapter_id
+        })
+
+        ch = question.chapter_id
+        diff = question.difficulty
+        if ch not in performance_map:
+            performance_map[ch] = {'easy': 0, 'medium': 0, 'hard': 0}
+        if is_correct:
+            performance_map[ch][diff] += 1
+            correct_answers += 1
+
+        difficulty_count.setdefault((ch, diff), 0)
+        difficulty_count[(ch, diff)] += 1
+
+    return GradedSubmission(responses, performance_map, difficulty_count, correct_answers, len(answers))
+
+
+def record_attempt(user_id, quiz_id, graded, time_taken):
+    """
+    Adds the attempt, its responses and the per-chapter performance rows to the
+    current session with bulk inserts, and folds the results into the user's
+    mastery totals. Nothing is committed.
+    """
+    user_quiz = UserQuiz(user_id=user_id, quiz_id=quiz_id, time_taken=time_taken, score=graded.score)
+    db.session.add(user_quiz)
+    db.session.flush()
+
+    if graded.responses:
+        db.session.execute(
+            insert(UserResponse),
+            [dict(response, attempt_id=user_quiz.id) for response in graded.responses]
+        )
+
+    performance_rows = []
+    for ch_id, counts in graded.performance_map.items():
+        row = {'user_id': user_id, 'chapter_id': ch_id, 'quiz_id': quiz_id}
+        for difficulty in DIFFICULTIES:
+            row[f'{difficulty}_correct'] = counts[difficulty]
+            row[f'{difficulty}_total'] = graded.difficulty_count.get((ch_id, difficulty), 0)
+        performance_rows.append(row)
+    if performance_rows:
+        db.session.execute(insert(Performance), performance_rows)
+
+    update_mastery(user_id, graded)
+    return user_quiz
+
+
+def next_quiz_remarks(user_id):
+    quiz_count = Quiz.query.filter_by(user_id=user_id).count()
+    if quiz_count == 0:
+        return "First Step"
+    return f"Next Step {quiz_count}"
+
+
+def create_quiz(user_id, question_ids, duration, remarks, selected_chapter=None, difficulty=None):
+    """
+    Adds a quiz and its question links to the current session. Nothing is committed.
+    `selected_chapter`/`difficulty` record the agent's action, for offline training.
+    """
+    quiz = Quiz(user_id=user_id, duration=duration, remarks=remarks, selected_chapter=selected_chapter,
+                difficulty=difficulty)
+    db.session.add(quiz)
+    db.session.flush()
+
+    if question_ids:
+        db.session.execute(
+            insert(QuizQuestion),
+            [{'quiz_id': quiz.id, 'question_id': q_id} for q_id in question_ids]
+        )
+    return quiz
@@ -1,7 +1,14 @@
 from app import app  # Ensure your app instance is correctly imported
 from extensions import db
+import argparse
+import os
+import time
 import pandas as pd
+from sqlalchemy import insert
 from models import Chapters, Questions
+from mastery import DIFFICULTIES
+
+REQUIRED_COLUMNS = ['Chapter', 'Question', 'Difficulty', 'Option_A', 'Option_B', 'Option_C', 'Option_D', 'Answer']
 
 def seed_chapters():
     chapters_data = [
@@ -13,41 +20,114 @@ def seed_chapters():
         ("Real Numbers", "Real Numbers are all the numbers that can be found on the number line including both rational and irrational numbers.")
     ]
 
+    existing = {name for (name,) in db.session.query(Chapters.name).all()}
     for name, description in chapters_data:
-        existing = Chapters.query.filter_by(name=name).first()
-        if not existing:
+        if name not in existing:
             db.session.add(Chapters(name=name, description=description))
     db.session.commit()
     print("Chapters seeded.")
 
-def import_questions_from_excel(file_path):
-    df = pd.read_excel(file_path)
-
-    for _, row in df.iterrows():
-        chapter_name = row['Chapter'].strip()  # Strip spaces for consistency
-        chapter = Chapters.query.filter_by(name=chapter_name).first()
-        if not chapter:
-            print(f"Chapter not found: {chapter_name}")
-            continue
-
-        question = Questions(
-            chapter_id=chapter.id,
-            question=row['Question'],
-            difficulty=row['Difficulty'].lower(),
-            option_a=row['Option_A'],
-            option_b=row['Option_B'],
-            option_c=row['Option_C'],
-            option_d=row['Option_D'],
-            correct_answer=row['Answer']
-        )
-        db.session.add(question)
+def read_question_file(file_path):
+    """
+    Reads a question bank from .xlsx/.xls, .csv or .parquet. Text columns are
+    kept as strings so answers like "1" are not turned into numbers.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in ('.xlsx', '.xls'):
+        return pd.read_excel(file_path, dtype=str)
+    if extension == '.csv':
+        return pd.read_csv(file_path, dtype=str, keep_default_na=False, na_values=[''])
+    if extension == '.parquet':
+        try:
+            return pd.read_parquet(file_path)
+        except ImportError as e:
+            raise ImportError("Reading .parquet question banks needs pyarrow: pip install pyarrow") from e
+    raise ValueError(f"Unsupported question file type: {extension}")
+
+def validate_questions(df, chapter_ids):
+    """
+    Normalizes the sheet and drops invalid rows, without touching the database.
+    Returns the valid rows (with a chapter_id column) and the count dropped per reason.
+    """
+    missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    df = df[REQUIRED_COLUMNS].copy()
+    dropped = {}
+
+    incomplete = df.isna().any(axis=1)
+    for column in REQUIRED_COLUMNS:
+        df[column] = df[column].astype(str).str.strip()
+    incomplete |= (df == '').any(axis=1)
+    dropped['missing values'] = int(incomplete.sum())
+    df = df[~incomplete]
+
+    df['Difficulty'] = df['Difficulty'].str.lower()
+    bad_difficulty = ~df['Difficulty'].isin(DIFFICULTIES)
+    dropped['unknown difficulty'] = int(bad_difficulty.sum())
+    df = df[~bad_difficulty]
+
+    df['chapter_id'] = df['Chapter'].map(chapter_ids)
+    unknown_chapter = df['chapter_id'].isna()
+    dropped['unknown chapter'] = int(unknown_chapter.sum())
+    for chapter_name in df.loc[unknown_chapter, 'Chapter'].unique():
+        print(f"Chapter not found: {chapter_name}")
+    df = df[~unknown_chapter].astype({'chapter_id': 'int64'})
+
+    return df, dropped
 
+def import_questions(file_path, chunk_size=5000):
+    """
+    Bulk-imports a question bank. Chapter names are resolved once, rows are
+    validated in pandas, questions already stored (same chapter and text) or
+    repeated in the file are skipped, and the rest are written with chunked
+    Core inserts in one transaction.
+    """
+    started = time.perf_counter()
+    df = read_question_file(file_path)
+    total_rows = len(df)
+
+    chapter_ids = {name: ch_id for ch_id, name in db.session.query(Chapters.id, Chapters.name).all()}
+    df, dropped = validate_questions(df, chapter_ids)
+
+    existing = pd.DataFrame(db.session.query(Questions.chapter_id, Questions.question).all(),
+                            columns=['chapter_id', 'Question'])
+    existing['Question'] = existing['Question'].astype(str).str.strip()
+    before = len(df)
+    df = df.drop_duplicates(subset=['chapter_id', 'Question'])
+    df = df.merge(existing.drop_duplicates(), on=['chapter_id', 'Question'], how='left', indicator=True)
+    df = df[df['_merge'] == 'left_only']
+    dropped['duplicates'] = before - len(df)
+
+    records = df.rename(columns={
+        'Question': 'question', 'Difficulty': 'difficulty', 'Option_A': 'option_a', 'Option_B': 'option_b',
+        'Option_C': 'option_c', 'Option_D': 'option_d', 'Answer': 'correct_answer'
+    })[['chapter_id', 'question', 'difficulty', 'option_a', 'option_b', 'option_c', 'option_d',
+        'correct_answer']].to_dict('records')
+
+    for start in range(0, len(records), chunk_size):
+        db.session.execute(insert(Questions), records[start:start + chunk_size])
+        done = min(start + chunk_size, len(records))
+        print(f"Inserted {done}/{len(records)} questions ({time.perf_counter() - started:.1f}s)")
     db.session.commit()
-    print("Questions imported successfully.")
+
+    skipped = ', '.join(f"{count} {reason}" for reason, count in dropped.items() if count)
+    print(f"Questions imported successfully: {len(records)} of {total_rows} rows in "
+          f"{time.perf_counter() - started:.1f}s" + (f" (skipped {skipped})." if skipped else "."))
+    return len(records)
+
+def import_questions_from_excel(file_path):
+    return import_questions(file_path)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create the tables, seed chapters and import a question bank.")
+    parser.add_argument('file', nargs='?', default='Final.xlsx', help="Question bank (.xlsx, .xls, .csv or .parquet).")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="Rows per insert statement batch.")
+    args = parser.parse_args()
+
     with app.app_context():
         db.create_all()
         print("All tables created successfully.")
         seed_chapters()
-        import_questions_from_excel('Final.xlsx')
+        import_questions(args.file, chunk_size=args.chunk_size)
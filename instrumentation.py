@@ -0,0 +1,168 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from contextlib import nullcontext
+
+from flask import g, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_NULL_CONTEXT = nullcontext()
+
+
+class Histogram:
+    """
+    Prometheus-style cumulative histogram, one series per label tuple.
+    """
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(counts), total, n) for labels, (counts, total, n) in self._series.items()]
+        for labels, counts, total, n in sorted(items):
+            label_text = ','.join(f'{key}="{value}"' for key, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {n}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {n}')
+        return '\n'.join(lines)
+
+
+class _Stage:
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.instrumentation.stage_seconds.observe(
+            (self.instrumentation.current_endpoint(), self.name), time.perf_counter() - self.start)
+
+
+class Instrumentation:
+    """
+    Opt-in per-request metrics: wall time, SQL statement count and time, and
+    named stages (policy inference, question selection) per endpoint, rendered
+    in the Prometheus text format. Slow requests can be profiled with cProfile
+    on a sample of requests. Nothing is hooked up unless `init_app` is called
+    with instrumentation enabled; `stage()` is then a shared no-op context.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._local = threading.local()
+        self.request_seconds = Histogram('app_request_seconds', 'Request wall time.',
+                                         ('endpoint', 'method', 'status'), LATENCY_BUCKETS)
+        self.sql_statements = Histogram('app_request_sql_statements', 'SQL statements executed per request.',
+                                        ('endpoint',), STATEMENT_BUCKETS)
+        self.db_seconds = Histogram('app_request_db_seconds', 'Time spent executing SQL per request.',
+                                    ('endpoint',), LATENCY_BUCKETS)
+        self.stage_seconds = Histogram('app_stage_seconds', 'Time spent in instrumented stages.',
+                                       ('endpoint', 'stage'), LATENCY_BUCKETS)
+
+    def init_app(self, app, engine):
+        if not app.config.get('INSTRUMENTATION'):
+            return
+        self.enabled = True
+        self.profile_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.profile_slow = app.config.get('PROFILE_SLOW_MS', 500) / 1000.0
+        self.profile_dir = app.config.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.after_request(self._after_request)
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return _Stage(self, name)
+
+    def current_endpoint(self):
+        # Stages timed outside a request (e.g. background quiz jobs) are grouped together.
+        return getattr(self._local, 'endpoint', None) or 'background'
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.query_start = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if getattr(self._local, 'endpoint', None) is None:
+            return
+        self._local.statements += 1
+        self._local.db_time += time.perf_counter() - self._local.query_start
+
+    def _before_request(self):
+        self._local.endpoint = request.endpoint or 'unknown'
+        self._local.statements = 0
+        self._local.db_time = 0.0
+        g.instrumentation_profiler = None
+        if self.profile_rate and random.random() < self.profile_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                g.instrumentation_profiler = profiler
+            except ValueError:
+                pass  # another profiler is active on this thread
+        g.instrumentation_start = time.perf_counter()
+
+    def _after_request(self, response):
+        g.instrumentation_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        start = g.pop('instrumentation_start', None)
+        endpoint = getattr(self._local, 'endpoint', None)
+        if start is None or endpoint is None:
+            return
+        elapsed = time.perf_counter() - start
+        status = g.pop('instrumentation_status', 500)
+        self.request_seconds.observe((endpoint, request.method, str(status)), elapsed)
+        self.sql_statements.observe((endpoint,), self._local.statements)
+        self.db_seconds.observe((endpoint,), self._local.db_time)
+        self._local.endpoint = None
+
+        profiler = g.pop('instrumentation_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            if elapsed >= self.profile_slow:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                path = os.path.join(self.profile_dir, f"{endpoint}-{int(time.time() * 1000)}.prof")
+                profiler.dump_stats(path)
+                print(f"[INFO] Slow request {request.method} {request.path} ({elapsed * 1000:.0f} ms) "
+                      f"profiled to {path}")
+
+    def render(self):
+        return '\n'.join(h.render() for h in (self.request_seconds, self.sql_statements, self.db_seconds,
+                                               self.stage_seconds)) + '\n'
+
+
+instrumentation = Instrumentation()
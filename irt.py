@@ -0,0 +1,192 @@
+import argparse
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import torch
+from sqlalchemy import func, insert
+
+from extensions import db
+from models import Questions, ItemParameter, UserAbility
+from analytics import load_response_arrays
+
+# Prior location of b for questions that have not been calibrated yet.
+DIFFICULTY_PRIOR = {'easy': -1.0, 'medium': 0.0, 'hard': 1.0}
+
+
+def fit_irt(user_idx, item_idx, correct, n_users, n_items, model='2pl', epochs=20, batch_size=65536,
+            lr=0.05, seed=0, verbose=True):
+    """
+    Fits a 1PL (Rasch) or 2PL model, P(correct) = sigmoid(a_i * (theta_u - b_i)),
+    by minibatch gradient descent over the flat response arrays. Standard
+    normal priors on theta and b (and on log a) keep sparse users and items
+    from diverging. Returns (theta, b, a) as NumPy arrays.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    users = torch.as_tensor(user_idx, dtype=torch.int64)
+    items = torch.as_tensor(item_idx, dtype=torch.int64)
+    targets = torch.as_tensor(correct, dtype=torch.float32)
+    n = len(targets)
+
+    theta = torch.zeros(n_users, requires_grad=True)
+    b = torch.zeros(n_items, requires_grad=True)
+    log_a = torch.zeros(n_items, requires_grad=(model == '2pl'))
+    params = [theta, b] + ([log_a] if model == '2pl' else [])
+    optimizer = torch.optim.Adam(params, lr=lr)
+
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        order = torch.randperm(n, generator=generator)
+        total_loss = 0.0
+        for begin in range(0, n, batch_size):
+            batch = order[begin:begin + batch_size]
+            u, i = users[batch], items[batch]
+            logits = torch.exp(log_a[i]) * (theta[u] - b[i])
+            nll = torch.nn.functional.binary_cross_entropy_with_logits(logits, targets[batch], reduction='sum')
+            # Priors, scaled to this minibatch's share of the data.
+            prior = 0.5 * (theta.pow(2).sum() + b.pow(2).sum() + 4.0 * log_a.pow(2).sum()) * len(batch) / n
+            loss = (nll + prior) / len(batch)
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += nll.item()
+        if verbose:
+            print(f"[INFO] epoch {epoch + 1}/{epochs}: log-loss {total_loss / n:.4f} "
+                  f"({n / (time.perf_counter() - start):,.0f} responses/sec)")
+
+    return theta.detach().numpy(), b.detach().numpy(), torch.exp(log_a).detach().numpy()
+
+
+def calibrate(model='2pl', epochs=20, batch_size=65536, lr=0.05):
+    """
+    Fits item and ability parameters over every stored response and replaces
+    the item_parameter and user_ability tables. Commits.
+    """
+    arrays = load_response_arrays()
+    if len(arrays['is_correct']) == 0:
+        print("[INFO] No responses to calibrate on.")
+        return
+
+    user_ids, user_idx = np.unique(arrays['user_id'], return_inverse=True)
+    question_ids, item_idx = np.unique(arrays['question_id'], return_inverse=True)
+    theta, b, a = fit_irt(user_idx, item_idx, arrays['is_correct'], len(user_ids), len(question_ids),
+                          model=model, epochs=epochs, batch_size=batch_size, lr=lr)
+    user_counts = np.bincount(user_idx, minlength=len(user_ids))
+    item_counts = np.bincount(item_idx, minlength=len(question_ids))
+
+    now = datetime.now()
+    db.session.query(ItemParameter).delete()
+    db.session.query(UserAbility).delete()
+    db.session.execute(insert(ItemParameter), [{
+        'question_id': int(q_id), 'difficulty': float(b_i), 'discrimination': float(a_i),
+        'responses': int(count), 'calibrated_at': now
+    } for q_id, b_i, a_i, count in zip(question_ids, b, a, item_counts)])
+    db.session.execute(insert(UserAbility), [{
+        'user_id': int(u_id), 'ability': float(t), 'responses': int(count), 'calibrated_at': now
+    } for u_id, t, count in zip(user_ids, theta, user_counts)])
+    db.session.commit()
+    print(f"[INFO] Calibrated {len(question_ids)} questions and {len(user_ids)} users "
+          f"on {len(item_idx)} responses ({model}).")
+
+
+def get_user_ability(user_id):
+    return db.session.query(UserAbility.ability).filter_by(user_id=user_id).scalar()
+
+
+class ItemBank:
+    """
+    In-memory (a, b) for every question, refreshed when a new calibration
+    run is stored. Uncalibrated questions use a=1 and a b taken from their
+    easy/medium/hard label.
+    """
+
+    def __init__(self, recheck_seconds=60):
+        self.recheck_seconds = recheck_seconds
+        # (question_ids, a, b), replaced as one tuple so readers never mix two calibrations.
+        self.items = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+        self._calibrated_at = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self.rng = np.random.default_rng()
+
+    def ensure_fresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.recheck_seconds:
+            return
+        with self._lock:
+            calibrated_at = db.session.query(func.max(ItemParameter.calibrated_at)).scalar()
+            if self._checked_at is None or calibrated_at != self._calibrated_at:
+                self.load()
+                self._calibrated_at = calibrated_at
+            self._checked_at = now
+
+    def load(self):
+        rows = db.session.query(
+            Questions.id, Questions.difficulty, ItemParameter.difficulty, ItemParameter.discrimination
+        ).outerjoin(ItemParameter, ItemParameter.question_id == Questions.id).order_by(Questions.id).all()
+        question_ids = np.array([r[0] for r in rows], dtype=np.int64)
+        b = np.array([r[2] if r[2] is not None else DIFFICULTY_PRIOR.get(r[1], 0.0) for r in rows])
+        a = np.array([r[3] if r[3] is not None else 1.0 for r in rows])
+        self.items = (question_ids, a, b)
+
+    def information(self, question_ids, ability):
+        """
+        Fisher information a^2 * p * (1 - p) of each question at the given ability.
+        """
+        self.ensure_fresh()
+        bank_ids, bank_a, bank_b = self.items
+        positions = np.searchsorted(bank_ids, question_ids)
+        positions = np.clip(positions, 0, max(len(bank_ids) - 1, 0))
+        known = (len(bank_ids) > 0) & (bank_ids[positions] == question_ids)
+        a = np.where(known, bank_a[positions], 1.0)
+        b = np.where(known, bank_b[positions], 0.0)
+        p = 1.0 / (1.0 + np.exp(-a * (ability - b)))
+        return a * a * p * (1.0 - p)
+
+    def most_informative(self, question_ids, ability, k):
+        question_ids = np.asarray(question_ids, dtype=np.int64)
+        k = min(k, len(question_ids))
+        if k == 0:
+            return []
+        information = self.information(question_ids, ability)
+        top = np.argpartition(-information, k - 1)[:k]
+        return question_ids[top[np.argsort(-information[top])]].tolist()
+
+    def sample_informative(self, question_ids, ability, k, pool_factor=3):
+        """
+        Draws `k` questions from the `k * pool_factor` most informative ones at
+        `ability`, weighted by information, so students of similar ability (or
+        one student between calibration runs) do not all get the same quiz.
+        """
+        question_ids = np.asarray(question_ids, dtype=np.int64)
+        k = min(k, len(question_ids))
+        if k == 0:
+            return []
+        information = self.information(question_ids, ability)
+        pool_size = min(len(question_ids), k * pool_factor)
+        pool = np.argpartition(-information, pool_size - 1)[:pool_size]
+        # Floor the weights so items whose information underflows to 0 can still fill the quiz.
+        weights = information[pool] + 1e-12
+        return question_ids[self.rng.choice(pool, size=k, replace=False, p=weights / weights.sum())].tolist()
+
+
+item_bank = ItemBank()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Calibrate IRT item and ability parameters from all responses.")
+    parser.add_argument('--model', choices=['1pl', '2pl'], default='2pl')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=65536)
+    parser.add_argument('--lr', type=float, default=0.05)
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        calibrate(model=args.model, epochs=args.epochs, batch_size=args.batch_size, lr=args.lr)
+        print(f"[INFO] Calibration finished in {time.perf_counter() - started:.1f}s.")
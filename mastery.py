@@ -0,0 +1,86 @@
+import argparse
+
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects.sqlite import insert
+
+from extensions import db
+from models import Performance, UserMastery
+
+DIFFICULTIES = ['easy', 'medium', 'hard']
+
+
+def update_mastery(user_id, graded):
+    """
+    Adds a graded submission to the user's running totals with one upsert. Nothing is committed.
+    """
+    rows = [{
+        'user_id': user_id,
+        'chapter_id': ch_id,
+        'difficulty': difficulty,
+        'correct': graded.performance_map.get(ch_id, {}).get(difficulty, 0),
+        'total': answered
+    } for (ch_id, difficulty), answered in graded.difficulty_count.items()]
+    if not rows:
+        return
+
+    stmt = insert(UserMastery)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'chapter_id', 'difficulty'],
+        set_={
+            'correct': UserMastery.correct + stmt.excluded.correct,
+            'total': UserMastery.total + stmt.excluded.total
+        }
+    )
+    db.session.execute(stmt, rows)
+
+
+def get_mastery(user_id):
+    """
+    { (chapter_id, difficulty): (correct, total) } for one user.
+    """
+    rows = db.session.query(
+        UserMastery.chapter_id, UserMastery.difficulty, UserMastery.correct, UserMastery.total
+    ).filter_by(user_id=user_id).all()
+    return {(ch_id, difficulty): (correct, total) for ch_id, difficulty, correct, total in rows}
+
+
+def rebuild_mastery(user_id=None):
+    """
+    Recomputes user_mastery from the full Performance history, for one user or
+    everyone, with one INSERT ... SELECT per difficulty. Nothing is committed.
+    """
+    delete_query = UserMastery.query
+    if user_id is not None:
+        delete_query = delete_query.filter_by(user_id=user_id)
+    delete_query.delete(synchronize_session=False)
+
+    for difficulty in DIFFICULTIES:
+        correct_col = getattr(Performance, f'{difficulty}_correct')
+        total_col = getattr(Performance, f'{difficulty}_total')
+        query = select(
+            Performance.user_id,
+            Performance.chapter_id,
+            literal(difficulty),
+            func.sum(func.coalesce(correct_col, 0)),
+            func.sum(func.coalesce(total_col, 0))
+        ).group_by(Performance.user_id, Performance.chapter_id).having(func.sum(func.coalesce(total_col, 0)) > 0)
+        if user_id is not None:
+            query = query.where(Performance.user_id == user_id)
+
+        db.session.execute(
+            insert(UserMastery).from_select(['user_id', 'chapter_id', 'difficulty', 'correct', 'total'], query)
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Backfill the user_mastery rollup from Performance history.")
+    parser.add_argument('--user-id', type=int, help="Only rebuild this user's rows.")
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        db.create_all()
+        rebuild_mastery(args.user_id)
+        db.session.commit()
+        print(f"User mastery rebuilt: {UserMastery.query.count()} rows.")
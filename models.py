@@ -30,6 +30,7 @@ class Chapters(db.Model):
 
 class Questions(db.Model):
     __tablename__ = 'questions'
+    __table_args__ = (db.Index('ix_questions_chapter_difficulty', 'chapter_id', 'difficulty'),)
 
     id = db.Column(db.Integer, primary_key=True)
     chapter_id = db.Column(db.Integer, db.ForeignKey('chapters.id'), nullable=False)
@@ -47,11 +48,15 @@ class Questions(db.Model):
 
 class Quiz(db.Model):
     __tablename__ = 'quiz'
+    __table_args__ = (db.Index('ix_quiz_user', 'user_id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     duration = db.Column(db.Integer, nullable=False)
     remarks = db.Column(db.String(120))
+    # The (chapter, difficulty) the agent chose for this quiz; NULL for First Step quizzes.
+    selected_chapter = db.Column(db.Integer, nullable=True)
+    difficulty = db.Column(db.String(10), nullable=True)
 
     questions = db.relationship('QuizQuestion', backref='quiz', cascade='all, delete-orphan', lazy=True)
     user_attempts = db.relationship('UserQuiz', backref='quiz', lazy=True)
@@ -59,6 +64,7 @@ class Quiz(db.Model):
 
 class QuizQuestion(db.Model):
     __tablename__ = 'quiz_question'
+    __table_args__ = (db.Index('ix_quiz_question_quiz', 'quiz_id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
@@ -67,6 +73,7 @@ class QuizQuestion(db.Model):
 
 class UserQuiz(db.Model):
     __tablename__ = 'user_quiz'
+    __table_args__ = (db.Index('ix_user_quiz_user_timestamp', 'user_id', 'timestamp'),)
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -80,6 +87,7 @@ class UserQuiz(db.Model):
 
 class UserResponse(db.Model):
     __tablename__ = 'user_response'
+    __table_args__ = (db.Index('ix_user_response_attempt', 'attempt_id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     attempt_id = db.Column(db.Integer, db.ForeignKey('user_quiz.id'), nullable=False)
@@ -92,6 +100,7 @@ class UserResponse(db.Model):
 
 class Performance(db.Model):
     __tablename__ = 'performance'
+    __table_args__ = (db.Index('ix_performance_user_chapter', 'user_id', 'chapter_id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -107,3 +116,70 @@ class Performance(db.Model):
     hard_total = db.Column(db.Integer, default=0)
 
     quiz = db.relationship('Quiz', backref=db.backref('performance', lazy=True))
+
+
+class QuizJob(db.Model):
+    __tablename__ = 'quiz_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    performance = db.Column(db.Text, nullable=False)  # JSON performance map of the graded attempt
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=True)
+    selected_chapter = db.Column(db.Integer, nullable=True)
+    difficulty = db.Column(db.String(10), nullable=True)
+    error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+
+
+class PreparedQuiz(db.Model):
+    """
+    A next quiz planned ahead of time, with the policy state it was planned from.
+    """
+    __tablename__ = 'prepared_quiz'
+    __table_args__ = (db.Index('ix_prepared_quiz_user', 'user_id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    selected_chapter = db.Column(db.Integer, nullable=False)
+    difficulty = db.Column(db.String(10), nullable=False)
+    question_ids = db.Column(db.Text, nullable=False)  # JSON list
+    state = db.Column(db.Text, nullable=False)  # JSON list, the agent's input state
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+
+
+class UserMastery(db.Model):
+    """
+    Running per-(user, chapter, difficulty) totals, rolled up from every graded response.
+    """
+    __tablename__ = 'user_mastery'
+    __table_args__ = (db.UniqueConstraint('user_id', 'chapter_id', 'difficulty', name='uq_user_mastery'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    chapter_id = db.Column(db.Integer, db.ForeignKey('chapters.id'), nullable=False)
+    difficulty = db.Column(db.String(10), nullable=False)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ItemParameter(db.Model):
+    """
+    Item response theory parameters fitted by irt.py for one question.
+    """
+    __tablename__ = 'item_parameter'
+
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), primary_key=True)
+    difficulty = db.Column(db.Float, nullable=False)
+    discrimination = db.Column(db.Float, nullable=False, default=1.0)
+    responses = db.Column(db.Integer, nullable=False, default=0)
+    calibrated_at = db.Column(db.DateTime, nullable=False)
+
+
+class UserAbility(db.Model):
+    __tablename__ = 'user_ability'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    ability = db.Column(db.Float, nullable=False)
+    responses = db.Column(db.Integer, nullable=False, default=0)
+    calibrated_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,102 @@
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HasherBusy(Exception):
+    """
+    Raised when too many hashes are already queued, or one did not finish in time.
+    """
+
+
+def _hash(password, method):
+    if method:
+        return generate_password_hash(password, method=method)
+    return generate_password_hash(password)
+
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification on a small process pool, so a burst
+    of logins occupies those processes instead of the web workers' CPU time.
+    At most `max_pending` calls may be queued or running; beyond that, and
+    when a call takes longer than `timeout`, HasherBusy is raised so the route
+    can answer 503 instead of piling up. `method` is any Werkzeug hash method
+    (e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"); verification accepts
+    hashes made with any method. With `max_workers=0` everything runs inline.
+    """
+
+    def __init__(self, max_workers=2, max_pending=64, method=None, timeout=10.0, start_method=None):
+        self.max_workers = max_workers
+        self.method = method or None
+        self.timeout = timeout
+        # forkserver workers start from a clean process rather than forking a threaded server.
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.start_method = start_method
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created lazily, and again after a fork, since the pool's threads do not survive into child workers.
+        if self._executor is not None and self._executor_pid == os.getpid():
+            return self._executor
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context(self.start_method))
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _run(self, fn, *args):
+        if self.max_workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            executor = self._get_executor()
+            try:
+                return executor.submit(fn, *args).result(timeout=self.timeout)
+            except TimeoutError:
+                raise HasherBusy()
+            except BrokenProcessPool:
+                self._reset(executor)
+                raise
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def hash_many(self, passwords):
+        """
+        Hashes a batch (e.g. a roster import) across all pool processes. Not
+        subject to the queue limit, so a batch occupies the whole pool until it
+        is done; use a separate PasswordHasher from the one verifying logins.
+        """
+        if self.max_workers <= 0 or len(passwords) < 2:
+            return [_hash(password, self.method) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.max_workers * 4))
+        return list(self._get_executor().map(_hash, passwords, itertools.repeat(self.method), chunksize=chunksize))
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
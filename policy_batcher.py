@@ -0,0 +1,75 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class BatchedPolicy:
+    """
+    Coalesces act() calls from concurrent request threads into batched forward
+    passes. The first pending state opens a window of `max_wait_ms`; everything
+    that arrives before it closes (up to `max_batch_size`) shares one forward
+    pass through the policy returned by `get_policy`, restricted to the actions
+    returned by `get_valid_actions` when given.
+    """
+
+    def __init__(self, get_policy, max_batch_size=64, max_wait_ms=2.0, get_valid_actions=None):
+        self.get_policy = get_policy
+        self.get_valid_actions = get_valid_actions
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        # Started lazily, and again after a fork, since threads do not survive into child workers.
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, name='policy-batcher', daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _valid_actions(self):
+        return self.get_valid_actions() if self.get_valid_actions else None
+
+    def act(self, state, timeout=None):
+        if self.max_batch_size <= 1:
+            return self.get_policy().act(state, self._valid_actions())
+
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((state, future))
+        return future.result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            states = [state for state, _ in batch]
+            try:
+                actions = self.get_policy().act_batch(states, self._valid_actions())
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), action in zip(batch, actions):
+                future.set_result(action)
@@ -0,0 +1,180 @@
+"""
+Creates users in bulk from a roster, each student with a default quiz of two
+questions per chapter and difficulty.
+
+    python provisioning.py roster.csv
+    python provisioning.py roster.json
+
+CSV rosters need a header row with email, password and fullname columns and
+may add dob and is_admin. JSON rosters are a list of objects with the same
+keys, or {"users": [...]}.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from extensions import db
+from models import User, Chapters, Quiz, QuizQuestion
+from grading import create_quiz
+from mastery import DIFFICULTIES
+from question_index import question_index
+
+DEFAULT_QUIZ_DURATION = 15
+DEFAULT_QUESTIONS_PER_BUCKET = 2
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+
+
+def default_quiz_buckets(chapters):
+    """
+    The (chapter_id, difficulty) pools a "First Step" quiz draws from: every
+    pool with at least two questions. `chapters` is a list of (id, name).
+    """
+    buckets = []
+    for chapter_id, chapter_name in chapters:
+        for difficulty in DIFFICULTIES:
+            if len(question_index.pool(chapter_id, difficulty)) >= DEFAULT_QUESTIONS_PER_BUCKET:
+                buckets.append((chapter_id, difficulty))
+            else:
+                print(f"Not enough questions in chapter {chapter_name} for difficulty {difficulty}. Skipping.")
+    return buckets
+
+
+def sample_default_quiz(buckets):
+    question_ids = []
+    for chapter_id, difficulty in buckets:
+        question_ids.extend(question_index.sample(chapter_id, difficulty, DEFAULT_QUESTIONS_PER_BUCKET))
+    return question_ids
+
+
+def create_default_quiz_for_user(user_id):
+    chapters = db.session.query(Chapters.id, Chapters.name).order_by(Chapters.id).all()
+    create_quiz(user_id, sample_default_quiz(default_quiz_buckets(chapters)), duration=DEFAULT_QUIZ_DURATION,
+                remarks='First Step')
+    db.session.commit()
+
+
+def read_roster(source, fmt):
+    """
+    Parses a roster from a path or an open text stream; `fmt` is 'csv' or 'json'.
+    """
+    if isinstance(source, str):
+        with open(source, newline='', encoding='utf-8') as f:
+            return read_roster(f, fmt)
+    if fmt == 'json':
+        data = json.load(source)
+        return data.get('users', []) if isinstance(data, dict) else data
+    return list(csv.DictReader(source))
+
+
+def _is_admin(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+
+def provision_users(roster, hash_passwords=None, chunk_size=500):
+    """
+    Inserts every valid roster entry as a user and gives each non-admin a
+    default quiz, with a few bulk statements and one commit per chunk. A
+    chunk's passwords are hashed before its inserts, so the database write
+    lock is only held while the rows are written; chunks committed before an
+    error stay committed. Entries with missing fields, or whose email is
+    repeated or already registered, are skipped. `hash_passwords` maps a list
+    of passwords to their hashes.
+    Returns {'created': [{'email', 'user_id', 'quiz_id'}], 'skipped': [{'email', 'reason'}]}.
+    """
+    if hash_passwords is None:
+        hash_passwords = lambda passwords: [generate_password_hash(p) for p in passwords]
+
+    created, skipped, entries, seen = [], [], [], set()
+    for entry in roster:
+        if not isinstance(entry, dict):
+            skipped.append({'email': None, 'reason': 'not a user record'})
+            continue
+        email = str(entry.get('email') or '').strip()
+        if not email or not entry.get('password') or not entry.get('fullname'):
+            skipped.append({'email': email or None, 'reason': 'missing email, password or fullname'})
+        elif email in seen:
+            skipped.append({'email': email, 'reason': 'duplicate in roster'})
+        else:
+            seen.add(email)
+            entries.append(dict(entry, email=email))
+
+    existing = set()
+    emails = [entry['email'] for entry in entries]
+    for start in range(0, len(emails), chunk_size):
+        existing.update(email for (email,) in db.session.query(User.email)
+                        .filter(User.email.in_(emails[start:start + chunk_size])))
+    skipped.extend({'email': entry['email'], 'reason': 'already registered'}
+                   for entry in entries if entry['email'] in existing)
+    entries = [entry for entry in entries if entry['email'] not in existing]
+
+    chapters = db.session.query(Chapters.id, Chapters.name).order_by(Chapters.id).all()
+    buckets = default_quiz_buckets(chapters)
+    for start in range(0, len(entries), chunk_size):
+        chunk = entries[start:start + chunk_size]
+        # Hash outside any write transaction: the previous chunk is committed by now.
+        hashes = hash_passwords([str(entry['password']) for entry in chunk])
+        db.session.execute(insert(User), [{
+            'email': entry['email'],
+            'password': password_hash,
+            'fullname': entry['fullname'],
+            'dob': entry.get('dob') or None,
+            'is_admin': _is_admin(entry.get('is_admin'))
+        } for entry, password_hash in zip(chunk, hashes)])
+        # Read the ids back by email (unique) rather than with RETURNING, which SQLite
+        # can only keep in parameter order by inserting one row per statement.
+        user_ids = dict(db.session.query(User.email, User.id).filter(User.email.in_([e['email'] for e in chunk])))
+        users = [user_ids[entry['email']] for entry in chunk]
+
+        students = [user_id for entry, user_id in zip(chunk, users) if not _is_admin(entry.get('is_admin'))]
+        quiz_by_user = {}
+        if students:
+            db.session.execute(insert(Quiz), [{
+                'user_id': user_id, 'duration': DEFAULT_QUIZ_DURATION, 'remarks': 'First Step'
+            } for user_id in students])
+            quiz_by_user = {user_id: quiz_id for quiz_id, user_id in
+                            db.session.query(Quiz.id, Quiz.user_id).filter(Quiz.user_id.in_(students))
+                            .order_by(Quiz.id)}
+
+        links = []
+        for quiz_id in quiz_by_user.values():
+            links.extend({'quiz_id': quiz_id, 'question_id': q_id} for q_id in sample_default_quiz(buckets))
+        if links:
+            db.session.execute(insert(QuizQuestion), links)
+        db.session.commit()
+
+        created.extend({'email': entry['email'], 'user_id': user_id, 'quiz_id': quiz_by_user.get(user_id)}
+                       for entry, user_id in zip(chunk, users))
+        print(f"[INFO] Provisioned {len(created)}/{len(entries)} users")
+
+    return {'created': created, 'skipped': skipped}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('roster', help="Roster file (.csv or .json).")
+    parser.add_argument('--chunk-size', type=int, default=500, help="Users per batch of insert statements.")
+    parser.add_argument('--hash-workers', type=int, default=os.cpu_count() or 1,
+                        help="Processes hashing passwords in parallel (0 hashes inline).")
+    args = parser.parse_args()
+
+    from app import app
+    from password_hashing import PasswordHasher
+
+    hasher = PasswordHasher(max_workers=args.hash_workers, method=app.config['PASSWORD_HASH_METHOD'])
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        result = provision_users(read_roster(args.roster, 'json' if args.roster.endswith('.json') else 'csv'),
+                                 hash_passwords=hasher.hash_many, chunk_size=args.chunk_size)
+        for entry in result['skipped']:
+            print(f"[INFO] Skipped {entry['email']}: {entry['reason']}")
+        print(f"[INFO] Created {len(result['created'])} users, skipped {len(result['skipped'])} "
+              f"in {time.perf_counter() - started:.1f}s.")
+    hasher.shutdown()
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import event, func
+
+from extensions import db
+from models import Questions
+
+
+class QuestionIndex:
+    """
+    In-memory index of question ids grouped by (chapter_id, difficulty).
+
+    Only ids are kept, as compact int64 arrays, so selection can sample without
+    touching the questions table and then load just the chosen rows. The index
+    is rebuilt lazily: immediately after questions are inserted, updated or
+    deleted through this process's ORM session, and otherwise whenever a cheap
+    count/max(id) check (run at most every `recheck_seconds`) shows that another
+    process, e.g. a bulk import, changed the table.
+    """
+
+    def __init__(self, recheck_seconds=30):
+        self.recheck_seconds = recheck_seconds
+        self.pools = {}
+        self.all_ids = np.empty(0, dtype=np.int64)
+        self.rng = np.random.default_rng()
+        self.version = 0
+        self._signature = None
+        self._checked_at = 0.0
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._dirty = True
+
+    def _table_signature(self):
+        return tuple(db.session.query(func.count(Questions.id), func.max(Questions.id)).one())
+
+    def build(self):
+        rows = db.session.query(Questions.id, Questions.chapter_id, Questions.difficulty).all()
+        ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        keys = [(r[1], r[2]) for r in rows]
+
+        grouped = {}
+        for position, key in enumerate(keys):
+            grouped.setdefault(key, []).append(position)
+        self.pools = {key: ids[positions] for key, positions in grouped.items()}
+        self.all_ids = ids
+        self._signature = (len(rows), int(ids.max()) if len(rows) else None)
+        self._checked_at = time.monotonic()
+        self._dirty = False
+        self.version += 1
+
+    def ensure_fresh(self):
+        now = time.monotonic()
+        if not self._dirty and now - self._checked_at < self.recheck_seconds:
+            return
+
+        with self._lock:
+            if not self._dirty and now - self._checked_at < self.recheck_seconds:
+                return
+            if self._dirty or self._table_signature() != self._signature:
+                self.build()
+            else:
+                self._checked_at = now
+
+    def pool(self, chapter_id, difficulty):
+        self.ensure_fresh()
+        return self.pools.get((chapter_id, difficulty), np.empty(0, dtype=np.int64))
+
+    def keys(self):
+        """
+        The (chapter_id, difficulty) pools that have at least one question.
+        """
+        self.ensure_fresh()
+        return list(self.pools)
+
+    def _without(self, ids, exclude):
+        if exclude:
+            ids = ids[~np.isin(ids, np.fromiter(exclude, dtype=np.int64, count=len(exclude)))]
+        return ids
+
+    def candidates(self, chapter_id=None, difficulty=None, exclude=None):
+        """
+        Ids in the (chapter_id, difficulty) pool, or in the whole bank when no pool is given, minus `exclude`.
+        """
+        if chapter_id is None:
+            self.ensure_fresh()
+            return self._without(self.all_ids, exclude)
+        return self._without(self.pool(chapter_id, difficulty), exclude)
+
+    def _sample(self, ids, k, exclude):
+        ids = self._without(ids, exclude)
+        k = min(k, len(ids))
+        if k == 0:
+            return []
+        return ids[self.rng.choice(len(ids), size=k, replace=False)].tolist()
+
+    def sample(self, chapter_id, difficulty, k, exclude=None):
+        return self._sample(self.pool(chapter_id, difficulty), k, exclude)
+
+    def sample_any(self, k, exclude=None):
+        self.ensure_fresh()
+        return self._sample(self.all_ids, k, exclude)
+
+
+question_index = QuestionIndex()
+
+
+@event.listens_for(Questions, 'after_insert')
+@event.listens_for(Questions, 'after_update')
+@event.listens_for(Questions, 'after_delete')
+def _invalidate_question_index(mapper, connection, target):
+    question_index.invalidate()
+
+
+def load_questions(question_ids):
+    """
+    Fetches the given questions with a single IN query, preserving the order of `question_ids`.
+    """
+    if not question_ids:
+        return []
+    rows = Questions.query.filter(Questions.id.in_(question_ids)).all()
+    by_id = {q.id: q for q in rows}
+    return [by_id[q_id] for q_id in question_ids if q_id in by_id]
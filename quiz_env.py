@@ -1,30 +1,101 @@
+
 import numpy as np
 
+from extensions import db
+from mastery import DIFFICULTIES
+from models import Chapters
+
 class QuizEnv:
-    def __init__(self, chapter_count=6):
-        self.chapter_count = chapter_count
-        self.action_space = chapter_count * 3  # 6 chapters * 3 difficulty levels
+    """
+    Action and state layout for the agent: one action per (chapter, difficulty),
+    ordered by chapter and then difficulty, and a state with one entry per
+    action. Chapters are 1..chapter_count unless `chapter_ids` is given; with
+    the default six chapters this is the original 18-entry layout.
+    """
+
+    def __init__(self, chapter_count=6, chapter_ids=None, difficulties=DIFFICULTIES):
+        self.chapter_ids = list(chapter_ids) if chapter_ids is not None else list(range(1, chapter_count + 1))
+        self.difficulties = list(difficulties)
+        self.chapter_count = len(self.chapter_ids)
+        self.action_space = self.chapter_count * len(self.difficulties)
+        self.state_size = self.action_space
+        self._chapter_index = {chapter_id: i for i, chapter_id in enumerate(self.chapter_ids)}
+        self._difficulty_index = {difficulty: i for i, difficulty in enumerate(self.difficulties)}
+        # Dense chapter_id -> position lookup for vectorized encoding; -1 for unknown ids.
+        self._chapter_lookup = np.full(max(self.chapter_ids, default=0) + 1, -1, dtype=np.int64)
+        self._chapter_lookup[self.chapter_ids] = np.arange(self.chapter_count)
         self.state = None
 
+    @classmethod
+    def from_database(cls):
+        """
+        Layout over every chapter in the Chapters table.
+        """
+        return cls(chapter_ids=[chapter_id for (chapter_id,) in db.session.query(Chapters.id).order_by(Chapters.id)])
+
     def get_state(self, performance):
         state = []
-        for chapter_id in range(1, self.chapter_count + 1):
-            stats = performance.get(chapter_id, {'easy': 0, 'medium': 0, 'hard': 0})
+        for chapter_id in self.chapter_ids:
+            stats = performance.get(chapter_id, {})
 
             total = sum(stats.values()) or 1
-            state.extend([ 
-                stats['easy'] / total,
-                stats['medium'] / total,
-                stats['hard'] / total 
-            ])
+            state.extend(stats.get(difficulty, 0) / total for difficulty in self.difficulties)
         self.state = np.array(state)
         return self.state
 
+    def has_action(self, chapter, difficulty):
+        return chapter in self._chapter_index and difficulty in self._difficulty_index
+
     def decode_action(self, action):
-        chapter = action // 3 + 1
-        difficulty = ['easy', 'medium', 'hard'][action % 3]
-        return chapter, difficulty
+        chapter_pos, difficulty_pos = divmod(int(action), len(self.difficulties))
+        return self.chapter_ids[chapter_pos], self.difficulties[difficulty_pos]
 
     def encode_action(self, chapter, difficulty):
-        difficulty_map = {'easy': 0, 'medium': 1, 'hard': 2}
-        return (chapter - 1) * 3 + difficulty_map[difficulty]
+        return self._chapter_index[chapter] * len(self.difficulties) + self._difficulty_index[difficulty]
+
+    def encode_actions(self, chapter_ids, difficulties):
+        """
+        Vectorized encode_action over arrays; -1 where the chapter or difficulty is unknown.
+        """
+        chapter_ids = np.asarray(chapter_ids, dtype=np.int64)
+        known = (chapter_ids >= 0) & (chapter_ids < len(self._chapter_lookup))
+        chapter_pos = np.where(known, self._chapter_lookup[np.where(known, chapter_ids, 0)], -1)
+        difficulty_pos = np.array([self._difficulty_index.get(d, -1) for d in difficulties], dtype=np.int64)
+        actions = chapter_pos * len(self.difficulties) + difficulty_pos
+        return np.where((chapter_pos >= 0) & (difficulty_pos >= 0), actions, -1)
+
+    def sparse_states(self, rows, chapter_ids, difficulties, correct, total):
+        """
+        States from mastery counts, keeping only the non-zero entries: entry i
+        says student `rows[i]` answered `correct[i]` of `total[i]` questions in
+        (chapter_ids[i], difficulties[i]). Returns (rows, actions, values)
+        arrays, as taken by DQNPolicy.act_sparse.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        correct = np.asarray(correct, dtype=np.float64)
+        total = np.asarray(total, dtype=np.float64)
+        actions = self.encode_actions(chapter_ids, difficulties)
+        values = np.divide(correct, total, out=np.zeros_like(correct), where=total > 0)
+        keep = (actions >= 0) & (values != 0)
+        return rows[keep], actions[keep], values[keep]
+
+    def mastery_state(self, mastery):
+        """
+        Dense state from get_mastery(): correct/total per (chapter, difficulty), 0.0 when unanswered.
+        """
+        state = np.zeros(self.state_size)
+        if mastery:
+            keys = list(mastery)
+            counts = np.array(list(mastery.values()), dtype=np.float64).reshape(-1, 2)
+            _, actions, values = self.sparse_states(np.zeros(len(keys)), [ch for ch, _ in keys],
+                                                    [d for _, d in keys], counts[:, 0], counts[:, 1])
+            state[actions] = values
+        return state
+
+    def to_sparse(self, state):
+        """
+        (actions, values) of the non-zero entries of a dense state.
+        """
+        state = np.asarray(state, dtype=np.float64)
+        actions = np.flatnonzero(state)
+        return actions, state[actions]
@@ -0,0 +1,98 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from extensions import db
+from models import QuizJob
+
+
+class QuizJobRunner:
+    """
+    Builds next quizzes off the request thread. Jobs are rows in the quiz_job
+    table, so their status can be polled and jobs interrupted by a restart can
+    be picked up again with resume_pending(); the work itself runs on an
+    in-process thread pool. A job still 'running' `stale_after` seconds after
+    it was created is assumed to belong to a dead process.
+
+    `build_quiz(user_id, performance_map)` must add the quiz to the session
+    without committing and return (quiz_id, chapter, difficulty).
+    """
+
+    def __init__(self, app, build_quiz, max_workers=2, stale_after=300):
+        self.app = app
+        self.build_quiz = build_quiz
+        self.stale_after = stale_after
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='quiz-job')
+        self._swept_at = None
+        self._sweep_lock = threading.Lock()
+
+    def create(self, user_id, performance_map):
+        """
+        Adds a pending job to the current session. Call submit() once it is committed.
+        """
+        job = QuizJob(user_id=user_id, status='pending', performance=json.dumps(performance_map))
+        db.session.add(job)
+        db.session.flush()
+        return job
+
+    def submit(self, job_id):
+        return self.executor.submit(self._run, job_id)
+
+    def maybe_resume(self):
+        """
+        Runs resume_pending() in the background on the first call in this
+        process and then at most every `stale_after` seconds. Cheap enough to
+        call on every request.
+        """
+        now = time.monotonic()
+        if self._swept_at is not None and now - self._swept_at < self.stale_after:
+            return
+        with self._sweep_lock:
+            if self._swept_at is not None and now - self._swept_at < self.stale_after:
+                return
+            self._swept_at = now
+        self.executor.submit(self.resume_pending)
+
+    def resume_pending(self):
+        """
+        Re-queues pending jobs and stale running ones. Safe to run from several
+        processes at once: running jobs younger than `stale_after` are left to
+        their owner, and a job is only executed by whoever claims it first.
+        """
+        # created_at is CURRENT_TIMESTAMP, i.e. naive UTC.
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=self.stale_after)
+        with self.app.app_context():
+            QuizJob.query.filter(QuizJob.status == 'running', QuizJob.created_at < cutoff) \
+                .update({'status': 'pending'}, synchronize_session=False)
+            db.session.commit()
+            job_ids = [job_id for (job_id,) in db.session.query(QuizJob.id).filter_by(status='pending').all()]
+        for job_id in job_ids:
+            self.submit(job_id)
+        return len(job_ids)
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            claimed = QuizJob.query.filter_by(id=job_id, status='pending').update({'status': 'running'})
+            db.session.commit()
+            if not claimed:
+                return
+            job = db.session.get(QuizJob, job_id)
+
+            try:
+                # JSON object keys are strings; the performance map is keyed by chapter id.
+                performance_map = {int(ch): counts for ch, counts in json.loads(job.performance).items()}
+                quiz_id, chapter, difficulty = self.build_quiz(job.user_id, performance_map)
+                job.quiz_id = quiz_id
+                job.selected_chapter = chapter
+                job.difficulty = difficulty
+                job.status = 'done'
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"[ERROR] Quiz job {job_id} failed: {e}")
+                job = db.session.get(QuizJob, job_id)
+                job.status = 'failed'
+                job.error = str(e)[:255]
+                db.session.commit()
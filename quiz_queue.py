@@ -0,0 +1,98 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from extensions import db
+from models import PreparedQuiz
+
+
+class PreparedQuizQueue:
+    """
+    Keeps up to `depth` next quizzes planned ahead for each active student,
+    so submitting a quiz only has to claim one instead of running the policy
+    and question selection. Plans are rows in the prepared_quiz table holding
+    the question ids and the agent state they were planned from; a plan is
+    stale, and dropped, once any entry of the student's state has moved by
+    more than `max_drift`. Refills run on an in-process thread pool.
+
+    `plan_quiz(user_id)` must return (state, chapter, difficulty, question_ids)
+    without writing anything.
+    """
+
+    def __init__(self, app, plan_quiz, depth=1, max_drift=0.15, max_workers=1):
+        self.app = app
+        self.plan_quiz = plan_quiz
+        self.depth = depth
+        self.max_drift = max_drift
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='quiz-queue')
+        self._refilling = set()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.depth > 0
+
+    def claim(self, user_id, state):
+        """
+        Removes and returns the oldest plan that is still fresh for `state`, or
+        None. Stale plans are deleted. Runs in the caller's transaction.
+        """
+        if not self.enabled:
+            return None
+        plans = PreparedQuiz.query.filter_by(user_id=user_id).order_by(PreparedQuiz.id).all()
+        state = np.asarray(state, dtype=np.float64)
+
+        claimed, stale = None, []
+        for plan in plans:
+            planned_state = np.asarray(json.loads(plan.state), dtype=np.float64)
+            if planned_state.shape != state.shape or np.abs(planned_state - state).max() > self.max_drift:
+                stale.append(plan.id)
+            elif claimed is None:
+                claimed = plan
+
+        if stale:
+            PreparedQuiz.query.filter(PreparedQuiz.id.in_(stale)).delete(synchronize_session=False)
+        # Conditional delete, so a plan claimed by a concurrent request is not handed out twice.
+        if claimed is None or not PreparedQuiz.query.filter_by(id=claimed.id).delete(synchronize_session=False):
+            return None
+        return {
+            'question_ids': json.loads(claimed.question_ids),
+            'selected_chapter': claimed.selected_chapter,
+            'difficulty': claimed.difficulty
+        }
+
+    def refill(self, user_id):
+        """
+        Tops up the user's queue in the background. Call after committing.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            if user_id in self._refilling:
+                return None
+            self._refilling.add(user_id)
+        return self.executor.submit(self._refill, user_id)
+
+    def _refill(self, user_id):
+        try:
+            with self.app.app_context():
+                try:
+                    ready = PreparedQuiz.query.filter_by(user_id=user_id).count()
+                    for _ in range(self.depth - ready):
+                        state, chapter, difficulty, question_ids = self.plan_quiz(user_id)
+                        db.session.add(PreparedQuiz(
+                            user_id=user_id,
+                            selected_chapter=chapter,
+                            difficulty=difficulty,
+                            question_ids=json.dumps([int(q_id) for q_id in question_ids]),
+                            state=json.dumps([float(x) for x in state])
+                        ))
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"[ERROR] Failed to prepare a quiz for user {user_id}: {e}")
+        finally:
+            with self._lock:
+                self._refilling.discard(user_id)
@@ -1,53 +1,94 @@
+import numpy as np
+from sqlalchemy import func
+
+from extensions import db
+from models import UserQuiz, UserResponse
 from quiz_env import QuizEnv
-from dqn_agent import DQNAgent
-import random
-import torch
-import os
-from models import Questions
+from dqn_agent import get_policy
+from question_index import question_index
+from irt import item_bank
 
 AGENT_WEIGHTS_PATH = "dqn_agent_weights.pth"
+# Questions answered in this many of a student's latest attempts are not picked again when avoidable.
+RECENT_ATTEMPTS = 3
 
-def generate_adaptive_quiz(user_performance, target_chapter=None, target_difficulty=None, num_questions=20):
-    env = QuizEnv()
-    agent = DQNAgent(state_size=18, action_size=18)  # 6 chapters * 3 difficulties
+_layout = None
 
-    if os.path.exists(AGENT_WEIGHTS_PATH):
-        agent.model.load_state_dict(torch.load(AGENT_WEIGHTS_PATH))
-        agent.model.eval()
 
-    state = env.get_state(user_performance)
-    questions = []
-    selected_actions = set()
-    used_ids = set()
-    max_attempts = 100
-    attempts = 0
+def get_quiz_layout():
+    """
+    (env, valid_actions) for the chapters in the database. The valid actions
+    are the (chapter, difficulty) pools that have questions; the policy only
+    scores those. Rebuilt whenever the question index is.
+    """
+    global _layout
+    question_index.ensure_fresh()
+    layout = _layout
+    if layout is None or layout[0] != question_index.version:
+        env = QuizEnv.from_database()
+        keys = question_index.keys()
+        actions = env.encode_actions([ch for ch, _ in keys], [difficulty for _, difficulty in keys])
+        layout = (question_index.version, env, np.unique(actions[actions >= 0]))
+        _layout = layout
+    return layout[1], layout[2]
 
-    while len(questions) < num_questions and attempts < max_attempts:
-        attempts += 1
 
-        if target_chapter is not None and target_difficulty is not None:
-            action = env.encode_action(target_chapter, target_difficulty)
-        else:
-            action = agent.act(state)
+def cached_quiz_layout():
+    # For threads without an app context, e.g. the policy batcher: the layout last built by a request.
+    layout = _layout
+    return get_quiz_layout() if layout is None else (layout[1], layout[2])
+
+
+def get_agent_policy():
+    env, _ = cached_quiz_layout()
+    return get_policy(AGENT_WEIGHTS_PATH, state_size=env.state_size, action_size=env.action_space)
 
-        if action in selected_actions:
-            continue
-        selected_actions.add(action)
 
-        chapter, difficulty = env.decode_action(action)
+def recent_question_ids(user_ids, attempts=RECENT_ATTEMPTS):
+    """
+    { user_id: set of question ids answered in their latest `attempts` attempts }, with one query.
+    """
+    latest = db.session.query(
+        UserQuiz.id, UserQuiz.user_id,
+        func.row_number().over(partition_by=UserQuiz.user_id,
+                               order_by=(UserQuiz.timestamp.desc(), UserQuiz.id.desc())).label('n')
+    ).filter(UserQuiz.user_id.in_(user_ids)).subquery()
+    rows = db.session.query(latest.c.user_id, UserResponse.question_id) \
+        .join(UserResponse, UserResponse.attempt_id == latest.c.id) \
+        .filter(latest.c.n <= attempts).distinct()
+    recent = {}
+    for user_id, question_id in rows:
+        recent.setdefault(user_id, set()).add(question_id)
+    return recent
 
-        available_questions = Questions.query.filter_by(chapter_id=chapter, difficulty=difficulty).all()
-        random.shuffle(available_questions)
-        for q in available_questions:
-            if q.id not in used_ids:
-                questions.append(q)
-                used_ids.add(q.id)
-                break 
 
-    if len(questions) < num_questions:
-        all_questions = Questions.query.all()
-        remaining = [q for q in all_questions if q.id not in used_ids]
-        random.shuffle(remaining)
-        questions.extend(remaining[:num_questions - len(questions)])
+def select_adaptive_question_ids(target_chapter, target_difficulty, num_questions=20, ability=None, exclude=None):
+    """
+    One question from the (target_chapter, target_difficulty) pool the policy
+    chose, the rest from the whole bank. With a calibrated `ability`,
+    questions are drawn from the most informative ones for that ability under
+    the IRT item parameters; otherwise they are random. Questions in `exclude`
+    (e.g. recently answered) are only used when the bank has nothing else left.
+    """
+    used_ids = set(exclude or ())
+
+    if ability is None:
+        question_ids = question_index.sample(target_chapter, target_difficulty, 1, exclude=used_ids)
+    else:
+        question_ids = item_bank.sample_informative(
+            question_index.candidates(target_chapter, target_difficulty, used_ids), ability, 1)
+    used_ids.update(question_ids)
+
+    if len(question_ids) < num_questions:
+        missing = num_questions - len(question_ids)
+        if ability is None:
+            question_ids.extend(question_index.sample_any(missing, exclude=used_ids))
+        else:
+            question_ids.extend(item_bank.sample_informative(question_index.candidates(exclude=used_ids), ability,
+                                                             missing))
+
+    if len(question_ids) < num_questions and exclude:
+        # Small bank: repeat recently answered questions rather than return a short quiz.
+        question_ids.extend(question_index.sample_any(num_questions - len(question_ids), exclude=question_ids))
 
-    return questions
+    return question_ids
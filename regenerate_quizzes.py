@@ -0,0 +1,143 @@
+"""
+Gives every active student a fresh adaptive quiz from the current policy,
+e.g. after new weights have been published by train_dqn.py.
+
+Students are processed in batches ordered by id. Per batch, their states are
+built from one user_mastery query (the same normalized scores as
+get_user_performance_state, kept sparse), the policy picks all their next
+chapters and difficulties in one batched forward pass, and the quizzes and their question
+links are written with bulk inserts and committed. The last finished user id
+is saved to a checkpoint file after every batch, so an interrupted run picks
+up where it stopped with --resume.
+
+    python regenerate_quizzes.py --active-days 30
+    python regenerate_quizzes.py --resume
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert
+
+from extensions import db
+from models import User, UserQuiz, Quiz, QuizQuestion, UserMastery, UserAbility, PreparedQuiz
+from quiz_selector import get_agent_policy, get_quiz_layout, recent_question_ids, select_adaptive_question_ids
+
+CHECKPOINT_PATH = 'regenerate_checkpoint.json'
+
+
+def active_user_ids(active_days, after_user_id=0):
+    query = db.session.query(User.id).filter(User.is_admin.is_(False), User.id > after_user_id)
+    if active_days:
+        cutoff = datetime.now() - timedelta(days=active_days)
+        query = query.filter(User.id.in_(db.session.query(UserQuiz.user_id).filter(UserQuiz.timestamp >= cutoff)))
+    return [user_id for (user_id,) in query.order_by(User.id)]
+
+
+def build_states(user_ids, env):
+    """
+    The users' states as sparse (rows, actions, values), rows indexing `user_ids`.
+    """
+    row_of = {user_id: row for row, user_id in enumerate(user_ids)}
+    rows = db.session.query(
+        UserMastery.user_id, UserMastery.chapter_id, UserMastery.difficulty, UserMastery.correct, UserMastery.total
+    ).filter(UserMastery.user_id.in_(user_ids), UserMastery.total > 0).all()
+    user_col, chapter_ids, difficulties, correct, total = zip(*rows) if rows else ((),) * 5
+    return env.sparse_states([row_of[user_id] for user_id in user_col], chapter_ids, difficulties, correct, total)
+
+
+def regenerate_batch(user_ids, env, valid_actions, policy, num_questions=20):
+    actions = policy.act_sparse(*build_states(user_ids, env), len(user_ids), valid_actions=valid_actions)
+    abilities = dict(db.session.query(UserAbility.user_id, UserAbility.ability)
+                     .filter(UserAbility.user_id.in_(user_ids)))
+    quiz_counts = dict(db.session.query(Quiz.user_id, func.count(Quiz.id))
+                       .filter(Quiz.user_id.in_(user_ids)).group_by(Quiz.user_id))
+    recent = recent_question_ids(user_ids)
+
+    plans, chosen = {}, {}
+    for user_id, action in zip(user_ids, actions):
+        chapter, difficulty = env.decode_action(action)
+        chosen[user_id] = (chapter, difficulty)
+        plans[user_id] = select_adaptive_question_ids(chapter, difficulty, num_questions=num_questions,
+                                                  ability=abilities.get(user_id), exclude=recent.get(user_id))
+
+    first_new_id = (db.session.query(func.max(Quiz.id)).scalar() or 0) + 1
+    db.session.execute(insert(Quiz), [{
+        'user_id': user_id,
+        'duration': 10,
+        'remarks': f"Next Step {quiz_counts[user_id]}" if quiz_counts.get(user_id) else "First Step",
+        'selected_chapter': chosen[user_id][0],
+        'difficulty': chosen[user_id][1]
+    } for user_id in user_ids])
+    quiz_ids = dict((user_id, quiz_id) for quiz_id, user_id in db.session.query(Quiz.id, Quiz.user_id).filter(
+        Quiz.user_id.in_(user_ids), Quiz.id >= first_new_id).order_by(Quiz.id))
+    db.session.execute(insert(QuizQuestion), [
+        {'quiz_id': quiz_ids[user_id], 'question_id': q_id}
+        for user_id, question_ids in plans.items() for q_id in question_ids
+    ])
+    # Quizzes planned ahead with the previous policy no longer apply.
+    PreparedQuiz.query.filter(PreparedQuiz.user_id.in_(user_ids)).delete(synchronize_session=False)
+    db.session.commit()
+    return len(user_ids)
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def regenerate(active_days=30, batch_size=1000, checkpoint_path=CHECKPOINT_PATH, resume=False):
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint is None:
+        checkpoint = {'active_days': active_days, 'last_user_id': 0, 'created': 0,
+                      'started_at': datetime.now().isoformat(timespec='seconds')}
+    else:
+        active_days = checkpoint['active_days']
+        print(f"[INFO] Resuming after user {checkpoint['last_user_id']} ({checkpoint['created']} quizzes created)")
+
+    env, valid_actions = get_quiz_layout()
+    policy = get_agent_policy()
+    user_ids = active_user_ids(active_days, checkpoint['last_user_id'])
+    started = time.perf_counter()
+
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        checkpoint['created'] += regenerate_batch(batch, env, valid_actions, policy)
+        checkpoint['last_user_id'] = batch[-1]
+        save_checkpoint(checkpoint_path, checkpoint)
+
+        done = start + len(batch)
+        elapsed = time.perf_counter() - started
+        print(f"[INFO] {done}/{len(user_ids)} users, {done / elapsed:,.0f} quizzes/sec")
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    print(f"[INFO] Regenerated {checkpoint['created']} quizzes in {time.perf_counter() - started:.1f}s.")
+    return checkpoint['created']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--active-days', type=int, default=30,
+                        help="Only students with an attempt in this many days (0 for all students).")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Students per forward pass and commit.")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH, help="Progress file used by --resume.")
+    parser.add_argument('--resume', action='store_true', help="Continue an interrupted run from its checkpoint.")
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        regenerate(active_days=args.active_days, batch_size=args.batch_size, checkpoint_path=args.checkpoint,
+                   resume=args.resume)
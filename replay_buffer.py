@@ -0,0 +1,179 @@
+import numpy as np
+
+
+class ReplayBuffer:
+    """
+    Fixed-capacity ring buffer of (state, action, reward, next_state, done)
+    transitions stored in preallocated NumPy arrays.
+
+    sample() gathers into batch arrays that are allocated once and reused, so
+    the returned arrays are only valid until the next call to sample().
+    """
+
+    def __init__(self, capacity, state_size, seed=None):
+        self.capacity = capacity
+        self.state_size = state_size
+        self.states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.float32)
+        self.position = 0
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
+        self._batch = None
+
+    def __len__(self):
+        return self.size
+
+    def push(self, state, action, reward, next_state):
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        if next_state is None:
+            self.next_states[i] = 0.0
+            self.dones[i] = 1.0
+        else:
+            self.next_states[i] = next_state
+            self.dones[i] = 0.0
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return i
+
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        """
+        Appends n transitions at once; `dones` marks rows whose next state is terminal.
+        Returns the buffer slots that were written.
+        """
+        n = len(actions)
+        if n > self.capacity:
+            states, actions, rewards = states[-self.capacity:], actions[-self.capacity:], rewards[-self.capacity:]
+            next_states, dones = next_states[-self.capacity:], dones[-self.capacity:]
+            n = self.capacity
+
+        idx = (self.position + np.arange(n)) % self.capacity
+        self.states[idx] = states
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.next_states[idx] = next_states
+        self.dones[idx] = dones
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        return idx
+
+    def _batch_arrays(self, batch_size):
+        if self._batch is None or len(self._batch['actions']) != batch_size:
+            self._batch = {
+                'states': np.empty((batch_size, self.state_size), dtype=np.float32),
+                'actions': np.empty(batch_size, dtype=np.int64),
+                'rewards': np.empty(batch_size, dtype=np.float32),
+                'next_states': np.empty((batch_size, self.state_size), dtype=np.float32),
+                'dones': np.empty(batch_size, dtype=np.float32),
+            }
+        return self._batch
+
+    def gather(self, indices):
+        batch = self._batch_arrays(len(indices))
+        np.take(self.states, indices, axis=0, out=batch['states'])
+        np.take(self.actions, indices, out=batch['actions'])
+        np.take(self.rewards, indices, out=batch['rewards'])
+        np.take(self.next_states, indices, axis=0, out=batch['next_states'])
+        np.take(self.dones, indices, out=batch['dones'])
+        return batch
+
+    def sample(self, batch_size):
+        indices = self.rng.integers(0, self.size, size=batch_size)
+        batch = self.gather(indices)
+        batch['indices'] = indices
+        batch['weights'] = None
+        return batch
+
+
+class SumTree:
+    """
+    Binary tree over `capacity` leaf priorities where every node holds the sum
+    of its children. Lookups and updates are O(log n) and run for a whole batch
+    of leaves at once.
+    """
+
+    def __init__(self, capacity):
+        self.leaf_count = 1
+        while self.leaf_count < capacity:
+            self.leaf_count *= 2
+        self.depth = self.leaf_count.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaf_count, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def update(self, leaves, priorities):
+        nodes = np.asarray(leaves) + self.leaf_count
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        Leaf index whose cumulative priority range contains each of `values`.
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values > left_sum
+            values -= left_sum * go_right
+            nodes = left + go_right
+        return nodes - self.leaf_count
+
+    def get(self, leaves):
+        return self.tree[np.asarray(leaves) + self.leaf_count]
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Proportional prioritized experience replay (Schaul et al., 2016).
+    New transitions get the current maximum priority so they are seen at least once.
+    """
+
+    def __init__(self, capacity, state_size, alpha=0.6, beta=0.4, beta_increment=0.001, eps=1e-3, seed=None):
+        super().__init__(capacity, state_size, seed=seed)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+        self.tree = SumTree(capacity)
+        self.max_priority = 1.0
+
+    def push(self, state, action, reward, next_state):
+        idx = super().push(state, action, reward, next_state)
+        self.tree.update(idx, self.max_priority)
+        return idx
+
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        idx = super().push_batch(states, actions, rewards, next_states, dones)
+        self.tree.update(idx, self.max_priority)
+        return idx
+
+    def sample(self, batch_size):
+        total = self.tree.total()
+        segment = total / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        indices = np.minimum(self.tree.find(np.minimum(values, total)), self.size - 1)
+
+        probs = self.tree.get(indices) / total
+        weights = (self.size * probs) ** (-self.beta)
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        batch = self.gather(indices)
+        batch['indices'] = indices
+        batch['weights'] = weights.astype(np.float32)
+        return batch
+
+    def update_priorities(self, indices, td_errors):
+        priorities = (np.abs(td_errors) + self.eps) ** self.alpha
+        self.tree.update(indices, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
@@ -0,0 +1,203 @@
+"""
+Offline DQN training on the stored quiz history.
+
+Every graded attempt becomes one transition: the state is the student's
+accuracy (correct / answered) per chapter and difficulty before the attempt,
+for every chapter in the database, exactly as get_user_performance_state
+builds it for serving. The action is the (chapter, difficulty) the agent chose
+for the quiz, as stored on it; attempts at quizzes without one (First Step
+quizzes, or quizzes created before the action was recorded) only advance the
+student's state. The reward is
+DQNAgent.compute_reward on the attempt's results, and the next state is the
+student's state afterwards. History is streamed from the database in chunks
+into a fixed-size replay buffer, so memory stays bounded however long the
+history is.
+
+    python train_dqn.py --epochs 3 --publish
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import torch
+from sqlalchemy import select
+
+from extensions import db
+from models import Quiz, UserQuiz, UserResponse, Questions
+from quiz_env import QuizEnv
+from dqn_agent import DQNAgent
+from mastery import DIFFICULTIES
+from quiz_selector import AGENT_WEIGHTS_PATH
+
+CHECKPOINT_DIR = 'checkpoints'
+
+
+def iter_attempts(chunk_size=50000):
+    """
+    Yields (user_id, (selected_chapter, difficulty), [(chapter_id, difficulty, is_correct), ...])
+    per attempt, ordered by user and then attempt, streaming the responses in
+    chunks. The action is (None, None) for quizzes that did not record one.
+    """
+    query = select(
+        UserQuiz.user_id, UserResponse.attempt_id, Quiz.selected_chapter, Quiz.difficulty,
+        Questions.chapter_id, Questions.difficulty, UserResponse.is_correct
+    ).join(UserQuiz, UserResponse.attempt_id == UserQuiz.id) \
+        .join(Quiz, UserQuiz.quiz_id == Quiz.id) \
+        .join(Questions, UserResponse.question_id == Questions.id) \
+        .order_by(UserQuiz.user_id, UserQuiz.id) \
+        .execution_options(yield_per=chunk_size)
+
+    current_attempt, current_user, current_action, responses = None, None, None, []
+    for user_id, attempt_id, selected_chapter, selected_difficulty, chapter_id, difficulty, is_correct \
+            in db.session.execute(query):
+        if attempt_id != current_attempt:
+            if responses:
+                yield current_user, current_action, responses
+            current_attempt, current_user, responses = attempt_id, user_id, []
+            current_action = (selected_chapter, selected_difficulty)
+        responses.append((chapter_id, difficulty, is_correct))
+    if responses:
+        yield current_user, current_action, responses
+
+
+def iter_transitions(env, agent, chunk_size=50000):
+    """
+    Yields (state, action, reward, next_state) for every attempt whose quiz
+    recorded a (chapter, difficulty) that fits the environment's action space.
+    """
+    # Correct and answered counts per action so far, as user_mastery holds them; the state is their
+    # ratio, 0.0 where nothing was answered, the same as QuizEnv.mastery_state.
+    correct = np.zeros(env.state_size)
+    answered = np.zeros(env.state_size)
+
+    def get_state():
+        return np.divide(correct, answered, out=np.zeros_like(correct), where=answered > 0)
+
+    current_user = None
+    for user_id, (chapter_id, difficulty), responses in iter_attempts(chunk_size):
+        if user_id != current_user:
+            current_user = user_id
+            correct[:] = 0
+            answered[:] = 0
+
+        state = get_state()
+
+        attempt_performance = {}
+        for question_chapter, question_difficulty, is_correct in responses:
+            if not env.has_action(question_chapter, question_difficulty):
+                continue
+            attempt_performance.setdefault(question_chapter, {d: 0 for d in DIFFICULTIES})
+            answered[env.encode_action(question_chapter, question_difficulty)] += 1
+            if is_correct:
+                attempt_performance[question_chapter][question_difficulty] += 1
+                correct[env.encode_action(question_chapter, question_difficulty)] += 1
+
+        if not env.has_action(chapter_id, difficulty):
+            continue
+        action = env.encode_action(chapter_id, difficulty)
+        reward = agent.compute_reward(attempt_performance, action)
+        yield state, action, reward, get_state()
+
+
+def next_checkpoint_path(directory=CHECKPOINT_DIR):
+    os.makedirs(directory, exist_ok=True)
+    versions = [int(name[len('dqn_v'):-len('.pth')]) for name in os.listdir(directory)
+                if name.startswith('dqn_v') and name.endswith('.pth') and name[len('dqn_v'):-len('.pth')].isdigit()]
+    return os.path.join(directory, f"dqn_v{max(versions, default=0) + 1}.pth")
+
+
+def publish(checkpoint_path, weights_path=AGENT_WEIGHTS_PATH):
+    # Atomic replace, so serving processes never read a half-written file.
+    tmp_path = weights_path + '.tmp'
+    shutil.copyfile(checkpoint_path, tmp_path)
+    os.replace(tmp_path, weights_path)
+
+
+def train(epochs=3, chunk_size=50000, buffer_size=100000, batch_size=256, replay_ratio=0.25,
+          prioritized=False, init_from=AGENT_WEIGHTS_PATH):
+    env = QuizEnv.from_database()
+    agent = DQNAgent(state_size=env.state_size, action_size=env.action_space, memory_size=buffer_size,
+                     prioritized=prioritized, env=env)
+    if init_from and os.path.exists(init_from):
+        agent.load(init_from)
+    agent.model.train()
+
+    stats = {'epochs': epochs, 'chapter_ids': env.chapter_ids, 'transitions': 0, 'updates': 0, 'losses': []}
+    started = time.perf_counter()
+
+    for epoch in range(epochs):
+        epoch_start = time.perf_counter()
+        transitions, updates, losses = 0, 0, []
+        states, actions, rewards, next_states = [], [], [], []
+
+        def flush():
+            nonlocal updates
+            agent.memory.push_batch(np.array(states, dtype=np.float32), np.array(actions), np.array(rewards),
+                                    np.array(next_states, dtype=np.float32), np.zeros(len(actions)))
+            # Train on replay_ratio samples per transition ingested, in minibatches.
+            for _ in range(max(1, round(len(actions) * replay_ratio / batch_size))):
+                loss = agent.replay(min(batch_size, len(agent.memory)))
+                if loss is not None:
+                    losses.append(loss)
+                    updates += 1
+            states.clear(), actions.clear(), rewards.clear(), next_states.clear()
+
+        for state, action, reward, next_state in iter_transitions(env, agent, chunk_size):
+            states.append(state)
+            actions.append(action)
+            rewards.append(reward)
+            next_states.append(next_state)
+            transitions += 1
+            if len(actions) >= chunk_size:
+                flush()
+        if actions:
+            flush()
+
+        elapsed = time.perf_counter() - epoch_start
+        mean_loss = float(np.mean(losses)) if losses else float('nan')
+        print(f"[INFO] epoch {epoch + 1}/{epochs}: {transitions} transitions, {updates} updates, "
+              f"loss {mean_loss:.4f}, {transitions / elapsed:,.0f} transitions/sec, "
+              f"{updates * batch_size / elapsed:,.0f} samples trained/sec")
+        stats['transitions'] += transitions
+        stats['updates'] += updates
+        stats['losses'].append(mean_loss)
+
+    stats['seconds'] = time.perf_counter() - started
+    return agent, stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--chunk-size', type=int, default=50000, help="Rows fetched and transitions buffered per step.")
+    parser.add_argument('--buffer-size', type=int, default=100000, help="Replay buffer capacity.")
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--replay-ratio', type=float, default=0.25,
+                        help="Transitions trained on per transition ingested.")
+    parser.add_argument('--prioritized', action='store_true', help="Use prioritized experience replay.")
+    parser.add_argument('--init-from', default=AGENT_WEIGHTS_PATH, help="Weights to start from, if present.")
+    parser.add_argument('--publish', action='store_true', help=f"Also replace {AGENT_WEIGHTS_PATH} for serving.")
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        torch.manual_seed(0)
+        agent, stats = train(epochs=args.epochs, chunk_size=args.chunk_size, buffer_size=args.buffer_size,
+                             batch_size=args.batch_size, replay_ratio=args.replay_ratio,
+                             prioritized=args.prioritized, init_from=args.init_from)
+
+    if stats['transitions'] == 0:
+        print("[INFO] No usable quiz history; nothing saved.")
+    else:
+        path = next_checkpoint_path()
+        agent.save(path)
+        with open(path[:-len('.pth')] + '.json', 'w') as f:
+            json.dump(dict(stats, checkpoint=path, created_at=time.strftime('%Y-%m-%dT%H:%M:%S')), f, indent=2)
+        print(f"[INFO] Saved {path} ({stats['transitions']} transitions in {stats['seconds']:.1f}s).")
+        if args.publish:
+            publish(path)
+            print(f"[INFO] Published to {AGENT_WEIGHTS_PATH}.")
@@ -0,0 +1,50 @@
+"""
+Brings an existing database up to the current schema: creates missing tables,
+adds missing nullable columns to existing ones, creates any indexes declared
+in models.py that the database does not have yet, then refreshes the query
+planner statistics. Safe to run repeatedly.
+
+    python upgrade_db.py
+"""
+import time
+
+from sqlalchemy import inspect, text
+
+from extensions import db
+
+
+def upgrade():
+    db.create_all()  # new tables, with their indexes
+
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                with db.engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                print(f"[INFO] Added {table.name}.{column.name}")
+
+    created = []
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                started = time.perf_counter()
+                index.create(bind=db.engine)
+                created.append(index.name)
+                print(f"[INFO] Created {index.name} on {table.name} in {time.perf_counter() - started:.1f}s")
+
+    if db.engine.dialect.name == 'sqlite':
+        with db.engine.begin() as conn:
+            conn.execute(text('ANALYZE'))
+    return created
+
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        created = upgrade()
+        print(f"[INFO] Schema up to date ({len(created)} indexes created).")